@@ -0,0 +1,10 @@
+"""Runs the stage and end to end benchmarks with their default settings.
+
+python3 -m benchmarks
+"""
+
+from benchmarks import end_to_end, stages
+
+if __name__ == "__main__":
+    stages.run()
+    end_to_end.run()
@@ -0,0 +1,11 @@
+import timeit
+from typing import Callable
+
+
+def measure(func: Callable[[], object], repeat: int = 5) -> float:
+    """Returns the best wall time of func in seconds out of repeat runs."""
+    return min(timeit.repeat(func, number=1, repeat=repeat))
+
+
+def report(name: str, seconds: float, count: int, unit: str = "points"):
+    print(f"{name:<28} {seconds * 1000:10.2f} ms {count / seconds:14.0f} {unit}/s")
@@ -0,0 +1,79 @@
+"""Exports synthetic workouts served by a local mock API and reports workouts/s.
+
+python3 -m benchmarks.end_to_end [-n NUM_WORKOUTS] [-f FILE_FORMAT ...] [--latency S]
+"""
+
+import argparse
+import tempfile
+import time
+from pathlib import Path
+from typing import Sequence
+
+from benchmarks.common import report
+from benchmarks.mock_server import MockApiServer
+from src.api import Api
+from src.exporters.registry import ExporterRegistry
+from src.scraper import Scraper
+
+
+def run(
+    num_workouts: int = 50,
+    duration: int = 3600,
+    file_formats: Sequence[str] = ("gpx",),
+    latency: float = 0.02,
+    error_rate: float = 0.0,
+    workers: int = 4,
+    parse_processes: int = 2,
+    writers: int = 1,
+    single_dataset: bool = False,
+):
+    registry = ExporterRegistry()
+    exporters = {
+        file_format: registry.get_exporter(file_format) for file_format in file_formats
+    }
+
+    with (
+        MockApiServer(
+            num_workouts, duration=duration, latency=latency, error_rate=error_rate
+        ) as server,
+        tempfile.TemporaryDirectory() as tmp_dir,
+    ):
+        # Retries back off quickly, so simulated errors don't dominate the timing
+        api = Api(server.endpoint, "token", pool_size=workers, backoff_factor=0.01)
+        scraper = Scraper(
+            api,
+            exporters,
+            Path(tmp_dir),
+            workers=workers,
+            single_dataset=single_dataset,
+            parse_processes=parse_processes,
+            writers=writers,
+        )
+
+        start = time.perf_counter()
+        scraper.run()
+        seconds = time.perf_counter() - start
+
+        print(f"{server.requests} requests, {server.errors} failed on purpose")
+        report(
+            f"end to end ({', '.join(file_formats)})",
+            seconds,
+            num_workouts,
+            "workouts",
+        )
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-n", "--num-workouts", default=50, type=int)
+    ap.add_argument("-d", "--duration", default=3600, type=int)
+    ap.add_argument(
+        "-f", "--file-format", dest="file_formats", nargs="+", default=["gpx"]
+    )
+    ap.add_argument("--latency", default=0.02, type=float)
+    ap.add_argument("--error-rate", default=0.0, type=float)
+    ap.add_argument("-w", "--workers", default=4, type=int)
+    ap.add_argument("-p", "--parse-processes", default=2, type=int)
+    ap.add_argument("--writers", default=1, type=int)
+    ap.add_argument("-s", "--single-dataset", action="store_true")
+    run(**vars(ap.parse_args()))
@@ -0,0 +1,139 @@
+import array
+import bisect
+import math
+import random
+from typing import List
+
+from src import constants
+from src.api import WorkoutDetailData, WorkoutSummary
+from src.exporters.base_exporter import NO_VALUE, ExportableTrack
+
+START_TIME = 1700000000
+
+
+def make_summary(trackid: int = START_TIME, duration: int = 3600) -> WorkoutSummary:
+    return WorkoutSummary(
+        trackid=str(trackid),
+        source="run.mifit.huami.com",
+        dis="10000",
+        calorie="600",
+        end_time=str(trackid + duration),
+        run_time=str(duration),
+        avg_pace="0.36",
+        avg_frequency="170",
+        avg_heart_rate="150",
+        type=1,
+        location="",
+        city="",
+        forefoot_ratio="",
+        bind_device="",
+        version=1,
+        app_name=constants.APP_NAME,
+    )
+
+
+def make_summaries(
+    count: int, duration: int = 3600, start_time: int = START_TIME
+) -> List[WorkoutSummary]:
+    """Builds the summaries of count workouts a day apart, newest first like the
+    history returned by the API."""
+    return [
+        make_summary(start_time + i * 86400, duration) for i in reversed(range(count))
+    ]
+
+
+def make_detail_data(
+    summary: WorkoutSummary,
+    duration: int = 3600,
+    sampling_interval: int = 1,
+    hr_interval: int = 1,
+    gait_interval: int = 3,
+    gap_ratio: float = 0.0,
+    pause_ratio: float = 0.0,
+    pause_length: int = 60,
+    seed: int = 0,
+) -> WorkoutDetailData:
+    """Generates a detail payload in the format served by the API.
+
+    GPS samples are taken every sampling_interval seconds, heart rate and gait
+    samples every hr_interval and gait_interval seconds. gap_ratio is the share of
+    altitude samples replaced by NO_VALUE, as happens when the barometer drops out.
+    pause_ratio is the share of seconds after which the recording pauses for
+    pause_length seconds, the summary's run time doesn't include the pauses.
+    """
+    rng = random.Random(seed)
+    num_points = max(duration // sampling_interval, 1)
+    pauses = (
+        sorted(rng.sample(range(1, duration), int(duration * pause_ratio)))
+        if pause_ratio
+        else []
+    )
+
+    def time_deltas(interval: int, count: int) -> List[int]:
+        times = [
+            i * interval + pause_length * bisect.bisect_right(pauses, i * interval)
+            for i in range(count)
+        ]
+        return [0] + [time - previous for previous, time in zip(times, times[1:])]
+
+    # Times and coordinates are deltas of the previous sample, the first one is
+    # relative to the start of the workout
+    time = ";".join(map(str, time_deltas(sampling_interval, num_points)))
+    lat = 4750000000
+    lon = 1900000000
+    coordinates = [f"{lat},{lon}"]
+    for i in range(1, num_points):
+        angle = 2 * math.pi * i / num_points
+        coordinates.append(
+            f"{int(1000 * math.cos(angle)) + rng.randint(-50, 50)},"
+            f"{int(-1000 * math.sin(angle)) + rng.randint(-50, 50)}"
+        )
+    altitude = ";".join(
+        str(NO_VALUE)
+        if rng.random() < gap_ratio
+        else str(10000 + int(1000 * math.sin(6 * math.pi * i / num_points)))
+        for i in range(num_points)
+    )
+
+    # Heart rate times and values are deltas too, an empty time means 1 second
+    heart_rate = ["0,120"]
+    for delta in time_deltas(hr_interval, max(duration // hr_interval, 1))[1:]:
+        heart_rate.append(f"{'' if delta == 1 else delta},{rng.randint(-2, 2)}")
+
+    gait = ";".join(
+        f"{delta},0,{100 + rng.randint(0, 20)},{160 + rng.randint(0, 20)}"
+        for delta in time_deltas(gait_interval, max(duration // gait_interval, 1))
+    )
+
+    empty_fields = {
+        field: ""
+        for field, info in WorkoutDetailData.model_fields.items()
+        if info.annotation is str
+    }
+    return WorkoutDetailData(
+        **{
+            **empty_fields,
+            "trackid": int(summary.trackid),
+            "source": summary.source,
+            "version": summary.version,
+            "time": time,
+            "longitude_latitude": ";".join(coordinates),
+            "altitude": altitude,
+            "heart_rate": ";".join(heart_rate),
+            "gait": gait,
+        }
+    )
+
+
+def make_track(num_points: int, start_time: int = START_TIME) -> ExportableTrack:
+    """Builds a synthetic track with one point per second along a circle."""
+    angles = [2 * math.pi * i / num_points for i in range(num_points)]
+    return ExportableTrack(
+        time=array.array("q", range(start_time, start_time + num_points)),
+        latitude=array.array("d", (47.5 + 0.01 * math.sin(a) for a in angles)),
+        longitude=array.array("d", (19.0 + 0.01 * math.cos(a) for a in angles)),
+        altitude=array.array("d", (100 + 10 * math.sin(3 * a) for a in angles)),
+        heart_rate=array.array("d", (140 + i % 30 for i in range(num_points))),
+        cadence=array.array("d", (170 + i % 10 for i in range(num_points))),
+        stride=array.array("d", (110 + i % 5 for i in range(num_points))),
+    )
@@ -0,0 +1,65 @@
+"""Compares the columnar GeoDataFrame construction with the former row based one.
+
+python3 -m benchmarks.geopandas_exporter [-n NUM_POINTS] [-r REPEAT]
+"""
+
+import argparse
+import tempfile
+from datetime import datetime
+from pathlib import Path
+
+import geopandas as gpd
+from shapely.geometry import Point
+
+from benchmarks.common import measure, report
+from benchmarks.fixtures import make_summary, make_track
+from src.exporters.geopandas_exporter import GeoPandasExporter, build_geodataframe
+
+
+def build_geodataframe_rows(summary, track):
+    track_date = datetime.utcfromtimestamp(int(summary.trackid)).isoformat()
+
+    data = [
+        {
+            "track_date": track_date,
+            "timestamp": point.time.isoformat(),
+            "latitude": point.latitude,
+            "longitude": point.longitude,
+            "altitude": point.altitude,
+            "heart_rate": point.heart_rate,
+            "cadence": point.cadence,
+            "geometry": Point(point.latitude, point.longitude),
+        }
+        for point in track
+    ]
+
+    gdf = gpd.GeoDataFrame(data, geometry="geometry")
+    gdf.geometry = gdf.geometry.set_crs(epsg=4326)
+    gdf.geometry = gdf.geometry.to_crs(epsg=4326)
+    return gdf
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-n", "--num-points", default=10000, type=int)
+    ap.add_argument("-r", "--repeat", default=5, type=int)
+    args = ap.parse_args()
+
+    summary = make_summary()
+    track = make_track(args.num_points)
+
+    for name, build in [
+        ("rows", build_geodataframe_rows),
+        ("columns", build_geodataframe),
+    ]:
+        seconds = measure(lambda: build(summary, track), args.repeat)
+        report(f"build ({name})", seconds, args.num_points)
+
+    exporter = GeoPandasExporter()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for file_format in ["gpkg", "parquet"]:
+            output_file_path = Path(tmp_dir) / f"workout.{file_format}"
+            seconds = measure(
+                lambda: exporter.export(output_file_path, summary, track), args.repeat
+            )
+            report(f"export ({file_format})", seconds, args.num_points)
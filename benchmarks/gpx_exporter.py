@@ -0,0 +1,71 @@
+"""Compares the batched GPX writer with the former per-point one.
+
+python3 -m benchmarks.gpx_exporter [-n NUM_POINTS] [-r REPEAT]
+"""
+
+import argparse
+import tempfile
+from datetime import datetime
+from pathlib import Path
+
+from benchmarks.common import measure, report
+from benchmarks.fixtures import make_summary, make_track
+from src.exporters.gpx_exporter import GpxExporter
+
+
+def export_per_point(output_file_path, summary, track):
+    ind = "\t"
+    with output_file_path.open(mode="w") as fp:
+        time = datetime.utcfromtimestamp(int(summary.trackid)).isoformat()
+        fp.write('<?xml version="1.0" encoding="UTF-8" standalone="no" ?>\n')
+        fp.write(f"{ind}<metadata><time>{time}</time></metadata>\n")
+        fp.write(f"{ind}<trk>\n")
+        fp.write(f"{ind}{ind}<trkseg>\n")
+        for point in track:
+            ext_hr = ""
+            ext_cadence = ""
+            if point.heart_rate:
+                ext_hr = (
+                    f"<gpxtpx:TrackPointExtension>"
+                    f"<gpxtpx:hr>{int(point.heart_rate)}</gpxtpx:hr>"
+                    f"</gpxtpx:TrackPointExtension>"
+                    f"<gpxdata:hr>{int(point.heart_rate)}</gpxdata:hr>"
+                )
+            if point.cadence:
+                ext_cadence = f"<gpxdata:cadence>{point.cadence}</gpxdata:cadence>"
+            fp.write(
+                f'{ind}{ind}{ind}<trkpt lat="{point.latitude}" lon="{point.longitude}">'
+                f"<ele>{point.altitude}</ele>"
+                f"<time>{point.time.isoformat()}</time>"
+                f"<extensions>"
+                f"{ext_hr}{ext_cadence}"
+                f"</extensions>"
+                f"</trkpt>\n"
+            )
+        fp.write(f"{ind}{ind}</trkseg>\n")
+        fp.write(f"{ind}</trk>\n")
+        fp.write("</gpx>")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-n", "--num-points", default=100000, type=int)
+    ap.add_argument("-r", "--repeat", default=5, type=int)
+    args = ap.parse_args()
+
+    summary = make_summary()
+    track = make_track(args.num_points)
+    exporter = GpxExporter()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for name, file_name, export in [
+            ("per point", "workout-per-point.gpx", export_per_point),
+            ("batched", "workout.gpx", exporter.export),
+            ("batched gzip", "workout.gpx.gz", exporter.export),
+        ]:
+            output_file_path = Path(tmp_dir) / file_name
+            seconds = measure(
+                lambda: export(output_file_path, summary, track), args.repeat
+            )
+            report(name, seconds, args.num_points)
+            print(f"{'':<28} {output_file_path.stat().st_size / 1024:10.0f} KiB")
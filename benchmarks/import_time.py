@@ -0,0 +1,55 @@
+"""Measures the startup cost of the CLI, i.e. the imports done before the first
+request, for a few file formats. Every case runs in a fresh interpreter.
+
+python3 -m benchmarks.import_time [-r REPEAT]
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+from benchmarks.common import measure
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+HEAVY_MODULES = ["geopandas", "pandas", "shapely", "pyogrio", "playwright", "numpy"]
+
+# Imports what main.py imports, then resolves the exporter of the format
+SCRIPT = """
+import json, resource, sys
+import main
+from src.exporters.registry import ExporterRegistry
+if sys.argv[1]:
+    ExporterRegistry().get_exporter(sys.argv[1])
+print(json.dumps({
+    "max_rss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    "heavy_modules": [name for name in %r if name in sys.modules],
+}))
+""" % (HEAVY_MODULES,)
+
+
+def run_case(file_format: str) -> dict:
+    output = subprocess.run(
+        [sys.executable, "-c", SCRIPT, file_format],
+        cwd=ROOT_DIR,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return json.loads(output)
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-r", "--repeat", default=5, type=int)
+    args = ap.parse_args()
+
+    for file_format in ["", "gpx", "gpkg"]:
+        seconds = measure(lambda: run_case(file_format), args.repeat)
+        result = run_case(file_format)
+        print(
+            f"{file_format or 'no exporter':<28} {seconds * 1000:10.2f} ms "
+            f"{result['max_rss'] / 1024:8.1f} MiB  "
+            f"heavy imports: {', '.join(result['heavy_modules']) or 'none'}"
+        )
@@ -0,0 +1,152 @@
+import json
+import random
+import threading
+import time
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Set
+from urllib.parse import parse_qs, urlparse
+
+from benchmarks.fixtures import make_detail_data, make_summaries
+from src.api import WorkoutSummary
+
+
+class MockApiServer:
+    """Local stand-in for the history.json and detail.json endpoints serving
+    synthetic workouts, with a configurable latency and share of failed requests.
+
+    with MockApiServer(num_workouts=100) as server:
+        api = Api(server.endpoint, "token")
+    """
+
+    def __init__(
+        self,
+        num_workouts: int = 100,
+        page_size: int = 20,
+        duration: int = 3600,
+        latency: float = 0.0,
+        error_rate: float = 0.0,
+        seed: int = 0,
+    ):
+        self.page_size: int = page_size
+        self.duration: int = duration
+        self.latency: float = latency
+        self.error_rate: float = error_rate
+        self.summaries: List[WorkoutSummary] = make_summaries(num_workouts, duration)
+        self.requests: int = 0
+        self.errors: int = 0
+        # Details answered with a 500 error, retried like any other
+        self.failing_track_ids: Set[str] = set()
+        # Details answered with an error code in a 200 response
+        self.rejected_track_ids: Set[str] = set()
+        self._by_trackid: Dict[str, WorkoutSummary] = {
+            summary.trackid: summary for summary in self.summaries
+        }
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def endpoint(self) -> str:
+        assert self._server, "The server isn't running"
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def get_history(self, from_track_id: Optional[str]) -> bytes:
+        start = 0
+        if from_track_id is not None:
+            start = next(
+                i
+                for i, summary in enumerate(self.summaries)
+                if summary.trackid == from_track_id
+            )
+        page = self.summaries[start : start + self.page_size]
+        end = start + self.page_size
+        next_track_id = (
+            int(self.summaries[end].trackid) if end < len(self.summaries) else -1
+        )
+        return json.dumps(
+            {
+                "code": 1,
+                "message": "success",
+                "data": {
+                    "next": next_track_id,
+                    "summary": [summary.model_dump() for summary in page],
+                },
+            }
+        ).encode()
+
+    @lru_cache(maxsize=None)
+    def get_detail(self, trackid: str) -> bytes:
+        summary = self._by_trackid[trackid]
+        data = make_detail_data(summary, self.duration, seed=int(trackid))
+        return json.dumps(
+            {"code": 1, "message": "success", "data": data.model_dump()}
+        ).encode()
+
+    def _should_fail(self) -> bool:
+        with self._lock:
+            self.requests += 1
+            if self._rng.random() < self.error_rate:
+                self.errors += 1
+                return True
+            return False
+
+    def _create_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlparse(self.path)
+                params = {key: values[0] for key, values in parse_qs(url.query).items()}
+
+                if server.latency:
+                    time.sleep(server.latency)
+
+                if server._should_fail():
+                    self.send_error(503)
+                    return
+
+                if url.path == "/v1/sport/run/history.json":
+                    body = server.get_history(params.get("trackid"))
+                elif url.path == "/v1/sport/run/detail.json":
+                    if params["trackid"] in server.failing_track_ids:
+                        self.send_error(500)
+                        return
+                    if params["trackid"] in server.rejected_track_ids:
+                        body = b'{"code": 0, "message": "error", "data": null}'
+                    else:
+                        body = server.get_detail(params["trackid"])
+                else:
+                    self.send_error(404)
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self) -> "MockApiServer":
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._create_handler())
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self) -> "MockApiServer":
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
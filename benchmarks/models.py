@@ -0,0 +1,59 @@
+"""Compares validating API responses from a decoded dict with validating the raw
+JSON bytes directly.
+
+python3 -m benchmarks.models [-n PAGE_SIZE] [-d DURATION] [-r REPEAT]
+"""
+
+import argparse
+import json
+
+from benchmarks.common import measure, report
+from benchmarks.fixtures import make_detail_data, make_summaries, make_summary
+from src.api import WorkoutDetail, WorkoutHistory
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-n", "--page-size", default=100, type=int)
+    ap.add_argument("-d", "--duration", default=3600, type=int)
+    ap.add_argument("-r", "--repeat", default=20, type=int)
+    args = ap.parse_args()
+
+    history = json.dumps(
+        {
+            "code": 1,
+            "message": "success",
+            "data": {
+                "next": -1,
+                "summary": [
+                    summary.model_dump() for summary in make_summaries(args.page_size)
+                ],
+            },
+        }
+    ).encode()
+
+    summary = make_summary(duration=args.duration)
+    detail = json.dumps(
+        {
+            "code": 1,
+            "message": "success",
+            "data": make_detail_data(summary, args.duration).model_dump(),
+        }
+    ).encode()
+    print(f"History page: {len(history)} bytes, detail: {len(detail)} bytes")
+
+    for name, model, content, count, unit in [
+        ("history", WorkoutHistory, history, args.page_size, "summaries"),
+        ("detail", WorkoutDetail, detail, 1, "details"),
+    ]:
+        report(
+            f"{name} (dict)",
+            measure(lambda: model(**json.loads(content)), args.repeat),
+            count,
+            unit,
+        )
+        report(
+            f"{name} (json)",
+            measure(lambda: model.model_validate_json(content), args.repeat),
+            count,
+            unit,
+        )
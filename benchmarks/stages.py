@@ -0,0 +1,114 @@
+"""Measures the throughput of every stage between a detail payload and an output file.
+
+python3 -m benchmarks.stages [-d DURATION] [-s SAMPLING_INTERVAL] [--gap-ratio RATIO]
+                            [--pause-ratio RATIO]
+"""
+
+import argparse
+import json
+import tempfile
+from pathlib import Path
+
+from benchmarks.common import measure, report
+from benchmarks.fixtures import make_detail_data, make_summary
+from src.exporters.base_exporter import (
+    build_track,
+    interpolate_data,
+    parse_points,
+    parse_track_data,
+)
+from src.exporters.detail_stream import parse_points_stream
+from src.exporters.registry import ExporterRegistry
+
+FILE_FORMATS = ["gpx", "gpx.gz", "gpkg", "parquet", "csv", "sqlite3"]
+
+
+def run(
+    duration: int = 3600,
+    sampling_interval: int = 1,
+    hr_interval: int = 1,
+    gait_interval: int = 3,
+    gap_ratio: float = 0.0,
+    pause_ratio: float = 0.0,
+    repeat: int = 5,
+):
+    summary = make_summary(duration=duration)
+    detail = make_detail_data(
+        summary,
+        duration,
+        sampling_interval=sampling_interval,
+        hr_interval=hr_interval,
+        gait_interval=gait_interval,
+        gap_ratio=gap_ratio,
+        pause_ratio=pause_ratio,
+    )
+
+    track_data = parse_track_data(summary, detail)
+    interpolated = interpolate_data(track_data)
+    track = build_track(interpolated)
+    num_points = len(track)
+    print(f"{len(track_data.lat)} GPS samples, {num_points} points after interpolation")
+
+    report(
+        "parse_track_data",
+        measure(lambda: parse_track_data(summary, detail), repeat),
+        num_points,
+    )
+    report(
+        "interpolate_data",
+        measure(lambda: interpolate_data(track_data), repeat),
+        num_points,
+    )
+    report(
+        "interpolate_data (fix gaps)",
+        measure(lambda: interpolate_data(track_data, fix_gaps=True), repeat),
+        num_points,
+    )
+    report(
+        "build_track",
+        measure(lambda: build_track(interpolated), repeat),
+        num_points,
+    )
+    report(
+        "parse_points",
+        measure(lambda: parse_points(summary, detail), repeat),
+        num_points,
+    )
+
+    body = json.dumps(
+        {"code": 1, "message": "success", "data": detail.model_dump()}
+    ).encode()
+    chunk_size = 1 << 16
+    report(
+        "parse_points_stream",
+        measure(
+            lambda: parse_points_stream(
+                summary,
+                (body[i : i + chunk_size] for i in range(0, len(body), chunk_size)),
+            ),
+            repeat,
+        ),
+        num_points,
+    )
+
+    registry = ExporterRegistry()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for file_format in FILE_FORMATS:
+            exporter = registry.get_exporter(file_format)
+            output_file_path = Path(tmp_dir) / f"workout.{file_format}"
+            seconds = measure(
+                lambda: exporter.export(output_file_path, summary, track), repeat
+            )
+            report(f"export ({file_format})", seconds, num_points)
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-d", "--duration", default=3600, type=int)
+    ap.add_argument("-s", "--sampling-interval", default=1, type=int)
+    ap.add_argument("--hr-interval", default=1, type=int)
+    ap.add_argument("--gait-interval", default=3, type=int)
+    ap.add_argument("--gap-ratio", default=0.0, type=float)
+    ap.add_argument("--pause-ratio", default=0.0, type=float)
+    ap.add_argument("-r", "--repeat", default=5, type=int)
+    run(**vars(ap.parse_args()))
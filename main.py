@@ -1,36 +1,27 @@
 import argparse
+import asyncio
 import logging
+from datetime import datetime
 from pathlib import Path
-from typing import List
 
-from src.api import Api
-from src.auth import get_app_token
-from src.exporters.base_exporter import BaseExporter
-from src.exporters.geopandas_exporter import GeoPandasExporter
-from src.exporters.gpx_exporter import GpxExporter
+from src.api import Api, WorkoutApi
+from src.auth import DEFAULT_TOKEN_CACHE_PATH, TokenCache, get_app_token
+from src.batch import Account, BatchRunner, load_accounts
+from src.cache import ResponseCache
+from src.exporters.registry import ExporterRegistry
+from src.filters import SummaryFilter
+from src.job_queue import JobQueue
+from src.metrics import Metrics, MetricsServer
+from src.profiler import WorkoutProfiler
 from src.scraper import Scraper
 
 
-def get_exporters() -> List[BaseExporter]:
-    exporters: List[BaseExporter] = [GpxExporter(), GeoPandasExporter()]
-    return exporters
-
-
-def get_supported_file_formats(exporters: List[BaseExporter]) -> List[str]:
-    supported_file_formats = [
-        file_format
-        for exporter in exporters
-        for file_format in exporter.get_supported_file_formats()
-    ]
-    assert len(supported_file_formats) > 0
-    return supported_file_formats
-
-
 if __name__ == "__main__":
     logging.basicConfig(level=logging.INFO)
 
-    exporters = get_exporters()
-    supported_file_formats = get_supported_file_formats(exporters)
+    registry = ExporterRegistry()
+    supported_file_formats = registry.get_supported_file_formats()
+    assert len(supported_file_formats) > 0
 
     ap = argparse.ArgumentParser()
     ap.add_argument(
@@ -40,12 +31,27 @@ if __name__ == "__main__":
         help="The endpoint to be used",
     )
     ap.add_argument("-t", "--token", help="A valid application token")
+    ap.add_argument(
+        "--token-cache",
+        default=DEFAULT_TOKEN_CACHE_PATH,
+        type=Path,
+        help="Where the token obtained by logging in is kept for the next runs, "
+        "it's reused until it expires or the API rejects it",
+    )
+    ap.add_argument(
+        "--no-token-cache",
+        action="store_true",
+        help="Log in with the browser on every run without keeping the token",
+    )
     ap.add_argument(
         "-f",
         "--file-format",
-        default=supported_file_formats[0],
+        dest="file_formats",
+        nargs="+",
+        default=[supported_file_formats[0]],
         choices=supported_file_formats,
-        help="File format of the exported workouts",
+        help="File formats of the exported workouts, the workouts are downloaded "
+        "and parsed once for all of them",
     )
     ap.add_argument(
         "-o",
@@ -54,19 +60,394 @@ if __name__ == "__main__":
         type=Path,
         help="A directory where the downloaded workouts will be stored",
     )
+    ap.add_argument(
+        "-w",
+        "--workers",
+        default=4,
+        type=int,
+        help="Number of workouts to download concurrently",
+    )
+    ap.add_argument(
+        "-p",
+        "--parse-processes",
+        default=2,
+        type=int,
+        help="Number of processes parsing workouts, 0 parses them in the main process",
+    )
+    ap.add_argument(
+        "--stream-details",
+        action="store_true",
+        help="Decode the workouts while they are downloaded instead of buffering "
+        "them, which uses much less memory. They are then parsed by the download "
+        "workers, -p is ignored",
+    )
+    ap.add_argument(
+        "--writers",
+        default=1,
+        type=int,
+        help="Number of workouts to write concurrently",
+    )
+    ap.add_argument(
+        "--queue-size",
+        default=16,
+        type=int,
+        help="Maximum number of workouts waiting between the download, parse and "
+        "write stages",
+    )
+    ap.add_argument(
+        "-i",
+        "--incremental",
+        action="store_true",
+        help="Only export workouts which are new or changed since the previous run",
+    )
+    ap.add_argument(
+        "-s",
+        "--single-dataset",
+        action="store_true",
+        help="Export all workouts into one dataset (gpkg, parquet, sql or sqlite3)",
+    )
+    ap.add_argument(
+        "--since",
+        type=datetime.fromisoformat,
+        help="Only export workouts started at or after this date (YYYY-MM-DD or an "
+        "ISO datetime), older history pages aren't fetched",
+    )
+    ap.add_argument(
+        "--until",
+        type=datetime.fromisoformat,
+        help="Only export workouts started before this date",
+    )
+    ap.add_argument(
+        "--type",
+        dest="types",
+        nargs="+",
+        type=int,
+        help="Only export workouts of these activity types",
+    )
+    ap.add_argument(
+        "--outdoor-only",
+        action="store_true",
+        help="Skip the activity types recorded without GPS, e.g. treadmill runs",
+    )
+    ap.add_argument(
+        "--min-distance",
+        default=0.0,
+        type=float,
+        help="Only export workouts of at least this many meters",
+    )
+    ap.add_argument(
+        "--limit",
+        type=int,
+        help="Only export the newest this many workouts passing the filters",
+    )
+    ap.add_argument(
+        "--max-retries",
+        default=5,
+        type=int,
+        help="Number of times a failed or throttled request is retried",
+    )
+    ap.add_argument(
+        "--rate-limit",
+        type=float,
+        help="Maximum number of requests per second sent to the API",
+    )
+    ap.add_argument(
+        "--timeout",
+        default=60.0,
+        type=float,
+        help="Seconds to wait for a connection or for data from the API before the "
+        "request is retried",
+    )
+    ap.add_argument(
+        "--cache-directory",
+        type=Path,
+        help="A directory where the API responses will be cached",
+    )
+    ap.add_argument(
+        "--cache-size",
+        type=int,
+        help="Maximum size of the response cache in megabytes",
+    )
+    ap.add_argument(
+        "--metrics-port",
+        type=int,
+        help="Serve the metrics of the run in the Prometheus format on this port",
+    )
+    ap.add_argument(
+        "--profile",
+        type=Path,
+        metavar="PROFILE_DIRECTORY",
+        help="Export the workouts one by one and save the cProfile stats of the "
+        "slowest ones to this directory",
+    )
+    ap.add_argument(
+        "--profile-top",
+        default=10,
+        type=int,
+        help="Number of slowest workouts whose profile is saved",
+    )
+    ap.add_argument(
+        "--async",
+        action="store_true",
+        help="Download with asyncio and httpx, -w then limits the number of "
+        "workouts in flight",
+    )
+    ap.add_argument(
+        "--accounts",
+        type=Path,
+        help="A JSON file listing the token and output directory of several "
+        "accounts, which are exported in one resumable batch",
+    )
+    ap.add_argument(
+        "--job-queue",
+        type=Path,
+        help="SQLite file recording the progress of the batch, defaults to the "
+        "accounts file with a .sqlite3 suffix",
+    )
+    ap.add_argument(
+        "--archive",
+        type=Path,
+        help="Export the workouts of a data export ZIP file downloaded from the GDPR "
+        "page instead of the API, no token is needed",
+    )
+    ap.add_argument(
+        "--archive-password",
+        help="Password of the data export ZIP file",
+    )
+    ap.add_argument(
+        "--offline",
+        action="store_true",
+        help="Only use cached API responses, requires --cache-directory",
+    )
 
     args = vars(ap.parse_args())
 
-    if not args["token"]:
-        args["token"] = get_app_token()
+    if args["offline"] and not args["cache_directory"]:
+        ap.error("--offline requires --cache-directory")
+
+    if args["async"] and (args["cache_directory"] or args["rate_limit"]):
+        ap.error("--async doesn't support --cache-directory and --rate-limit")
+
+    if args["accounts"] and args["profile"]:
+        ap.error("--accounts doesn't support --profile")
+
+    if args["async"] and args["job_queue"]:
+        ap.error("--async doesn't support --job-queue, resume the accounts with -i")
+
+    if args["stream_details"] and (args["async"] or args["accounts"]):
+        ap.error("--stream-details doesn't support --async and --accounts")
+
+    if args["archive"] and (args["accounts"] or args["async"] or args["offline"]):
+        ap.error("--archive doesn't support --accounts, --async and --offline")
 
-    if args["token"]:
-        api = Api(args["endpoint"], args["token"])
+    # Only the exporters of the requested formats are imported
+    selected_exporters = {
+        file_format: registry.get_exporter(file_format)
+        for file_format in args["file_formats"]
+    }
 
-        exporter = next(
-            exporter
-            for exporter in exporters
-            if args["file_format"] in exporter.get_supported_file_formats()
+    if args["single_dataset"] and not any(
+        file_format in exporter.get_dataset_file_formats()
+        for file_format, exporter in selected_exporters.items()
+    ):
+        ap.error(f"--single-dataset doesn't support {', '.join(args['file_formats'])}")
+
+    # The details of the workouts filtered out by their summaries aren't downloaded
+    summary_filter = SummaryFilter(
+        since=args["since"],
+        until=args["until"],
+        types=args["types"],
+        outdoor_only=args["outdoor_only"],
+        min_distance=args["min_distance"],
+        limit=args["limit"],
+    )
+
+    cache = (
+        ResponseCache(
+            args["cache_directory"],
+            max_size=args["cache_size"] * 1024 * 1024 if args["cache_size"] else None,
+        )
+        if args["cache_directory"]
+        else None
+    )
+
+    if args["accounts"] and args["async"]:
+        # Imported here, as httpx is an optional dependency
+        from src.async_api import AsyncApi, AsyncSession
+        from src.async_scraper import AsyncScraper, run_scrapers
+
+        async def run_accounts() -> None:
+            # The accounts are exported concurrently in one event loop, sharing
+            # the connections and the limit of requests in flight to the host
+            async with AsyncSession(
+                max_connections_per_host=args["workers"], timeout=args["timeout"]
+            ) as session:
+                scrapers = []
+                for account in load_accounts(args["accounts"]):
+                    api = AsyncApi(
+                        args["endpoint"],
+                        account.token,
+                        max_retries=args["max_retries"],
+                        metrics=Metrics(),
+                        session=session,
+                    )
+                    scrapers.append(
+                        AsyncScraper(
+                            api,
+                            selected_exporters,
+                            account.output_directory,
+                            workers=args["workers"],
+                            incremental=args["incremental"],
+                            single_dataset=args["single_dataset"],
+                            parse_processes=args["parse_processes"],
+                            summary_filter=summary_filter,
+                        )
+                    )
+                await run_scrapers(scrapers)
+
+        asyncio.run(run_accounts())
+
+    elif args["accounts"]:
+
+        def create_scraper(account: Account) -> Scraper:
+            api = Api(
+                args["endpoint"],
+                account.token,
+                pool_size=args["workers"],
+                max_retries=args["max_retries"],
+                rate_limit=args["rate_limit"],
+                cache=cache,
+                cache_only=args["offline"],
+                metrics=Metrics(),
+                cache_namespace=account.get_name(),
+                timeout=args["timeout"],
+            )
+            return Scraper(
+                api,
+                selected_exporters,
+                account.output_directory,
+                single_dataset=args["single_dataset"],
+                summary_filter=summary_filter,
+            )
+
+        job_queue = JobQueue(
+            args["job_queue"] or args["accounts"].with_suffix(".sqlite3")
+        )
+        try:
+            BatchRunner(
+                load_accounts(args["accounts"]),
+                create_scraper,
+                job_queue,
+                workers=args["workers"],
+            ).run()
+        finally:
+            job_queue.close()
+            if cache:
+                cache.close()
+
+    # Offline runs never reach the API, so any token will do
+    elif not args["token"] and not args["offline"] and not args["archive"]:
+        token_cache = (
+            TokenCache(args["token_cache"]) if not args["no_token_cache"] else None
+        )
+
+        # The browser is only opened when there's no usable cached token
+        if token_cache and (token := token_cache.load()):
+            if Api(args["endpoint"], token).check_token():
+                args["token"] = token
+            else:
+                logging.info("The cached token was rejected, logging in again")
+                token_cache.clear()
+
+        if not args["token"]:
+            args["token"] = get_app_token(token_cache)
+
+    if not args["accounts"] and (args["token"] or args["offline"] or args["archive"]):
+        metrics = Metrics()
+        profiler = (
+            WorkoutProfiler(args["profile"], top=args["profile_top"])
+            if args["profile"]
+            else None
+        )
+
+        metrics_server = (
+            MetricsServer(metrics, args["metrics_port"])
+            if args["metrics_port"]
+            else None
         )
-        scraper = Scraper(api, exporter, args["output_directory"], args["file_format"])
-        scraper.run()
+        if metrics_server:
+            metrics_server.start()
+
+        try:
+            if args["async"]:
+                # Imported here, as httpx is an optional dependency
+                from src.async_api import AsyncApi
+                from src.async_scraper import AsyncScraper
+
+                async def run_async() -> None:
+                    async with AsyncApi(
+                        args["endpoint"],
+                        args["token"] or "",
+                        max_connections_per_host=args["workers"],
+                        max_retries=args["max_retries"],
+                        timeout=args["timeout"],
+                        metrics=metrics,
+                    ) as api:
+                        await AsyncScraper(
+                            api,
+                            selected_exporters,
+                            args["output_directory"],
+                            workers=args["workers"],
+                            incremental=args["incremental"],
+                            single_dataset=args["single_dataset"],
+                            parse_processes=args["parse_processes"],
+                            profiler=profiler,
+                            summary_filter=summary_filter,
+                        ).run_async()
+
+                asyncio.run(run_async())
+            else:
+                # Both are served to the scraper through the WorkoutApi protocol
+                api: WorkoutApi
+                if args["archive"]:
+                    # Imported here, as it's only needed to read an archive
+                    from src.archive import ArchiveApi
+
+                    api = ArchiveApi(
+                        args["archive"],
+                        password=args["archive_password"],
+                        metrics=metrics,
+                    )
+                else:
+                    api = Api(
+                        args["endpoint"],
+                        args["token"] or "",
+                        pool_size=args["workers"],
+                        max_retries=args["max_retries"],
+                        rate_limit=args["rate_limit"],
+                        cache=cache,
+                        cache_only=args["offline"],
+                        metrics=metrics,
+                        timeout=args["timeout"],
+                    )
+                Scraper(
+                    api,
+                    selected_exporters,
+                    args["output_directory"],
+                    workers=args["workers"],
+                    incremental=args["incremental"],
+                    single_dataset=args["single_dataset"],
+                    parse_processes=args["parse_processes"],
+                    writers=args["writers"],
+                    queue_size=args["queue_size"],
+                    profiler=profiler,
+                    summary_filter=summary_filter,
+                    stream_details=args["stream_details"],
+                ).run()
+        finally:
+            if metrics_server:
+                metrics_server.stop()
+
+        if cache:
+            logging.info(f"Response cache: {cache.get_stats()}")
+            cache.close()
@@ -1,10 +1,27 @@
-from typing import Any, Dict, List, Optional
+import re
+import zlib
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Generator,
+    Iterator,
+    List,
+    Optional,
+    Protocol,
+)
 from urllib.parse import urljoin
 
 import requests
 from pydantic import BaseModel
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 from src import constants
+from src.cache import CacheMissError, ResponseCache
+from src.metrics import Metrics
+from src.rate_limiter import TokenBucket
 
 
 class WorkoutSummary(BaseModel):
@@ -148,10 +165,172 @@ class WorkoutDetail(BaseModel):
     data: WorkoutDetailData
 
 
+class WorkoutApi(Protocol):
+    """The source of the workouts used by Scraper, implemented by Api and
+    ArchiveApi."""
+
+    metrics: Metrics
+
+    def get_workout_history(
+        self, from_track_id: Optional[int] = None
+    ) -> WorkoutHistory: ...
+
+    def iter_workout_history(
+        self, prefetch: bool = True
+    ) -> Iterator[WorkoutHistory]: ...
+
+    def get_workout_detail_raw(self, workout: WorkoutSummary) -> bytes: ...
+
+    def iter_workout_detail_raw(
+        self, workout: WorkoutSummary, chunk_size: int = 1 << 16
+    ) -> Generator[bytes, None, None]: ...
+
+
+class _ResponseCodeReader:
+    """Reads the top level "code" of a JSON response fed in chunks, without parsing
+    the rest of it. Reading stops at the code, which the API sends first.
+
+    Only a number is read as the code, any other value is read as b"".
+    """
+
+    _STRING_STOP = re.compile(rb'["\\]')
+    _STRUCTURE = re.compile(rb'["{}\[\]:,]')
+
+    def __init__(self):
+        self.code: Optional[bytes] = None
+        self._depth: int = 0
+        self._in_string: bool = False
+        self._escape: bool = False
+        # The last string of the response object, its key when a ":" follows
+        self._string = bytearray()
+        self._value: Optional[bytearray] = None
+
+    def is_success(self) -> bool:
+        return self.code == str(constants.SUCCESS_CODE).encode()
+
+    def feed(self, data: bytes) -> None:
+        i = 0
+        while i < len(data) and self.code is None:
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                    i += 1
+                    continue
+                match = self._STRING_STOP.search(data, i)
+                end = match.start() if match else len(data)
+                if self._depth == 1:
+                    self._string += data[i:end]
+                if not match:
+                    return
+                self._escape = data[end : end + 1] == b"\\"
+                self._in_string = self._escape
+                i = end + 1
+                continue
+
+            match = self._STRUCTURE.search(data, i)
+            end = match.start() if match else len(data)
+            if self._value is not None:
+                self._value += data[i:end]
+            if not match:
+                return
+
+            char = data[end : end + 1]
+            if self._value is not None:
+                # The number ends with the code's key-value pair, a string or a
+                # container isn't a code
+                self.code = bytes(self._value).strip() if char in b",}" else b""
+            elif char == b'"':
+                self._in_string = True
+                self._string = bytearray()
+            elif char in b"{[":
+                self._depth += 1
+            elif char in b"}]":
+                self._depth -= 1
+            elif char == b":" and self._depth == 1 and self._string == b"code":
+                self._value = bytearray()
+            i = end + 1
+
+
+class _RateLimitedRetry(Retry):
+    """Retry calling before_retry after the backoff of every retry, so the retries
+    done inside urllib3, e.g. of throttled requests, go through the rate limiter
+    like the first attempts."""
+
+    before_retry: Optional[Callable[[], None]] = None
+
+    def new(self, **kw: Any) -> "_RateLimitedRetry":
+        # urllib3 creates a new Retry for every attempt from the init arguments
+        retry = super().new(**kw)
+        retry.before_retry = self.before_retry
+        return retry
+
+    def sleep(self, response=None) -> None:
+        super().sleep(response)
+        if self.before_retry:
+            self.before_retry()
+
+
 class Api:
-    def __init__(self, endpoint: str, token: str):
+    def __init__(
+        self,
+        endpoint: str,
+        token: str,
+        pool_size: int = 10,
+        max_retries: int = 5,
+        backoff_factor: float = 0.5,
+        rate_limit: Optional[float] = None,
+        cache: Optional[ResponseCache] = None,
+        cache_only: bool = False,
+        metrics: Optional[Metrics] = None,
+        cache_namespace: str = "",
+        timeout: Optional[float] = 60.0,
+    ):
+        assert cache or not cache_only, "Cache only mode requires a cache"
+        self.metrics: Metrics = metrics or Metrics()
         self.base_url: str = endpoint
         self.token: str = token
+        self.cache: Optional[ResponseCache] = cache
+        self.cache_only: bool = cache_only
+        # Identifies the account in the cache keys, so accounts sharing a cache
+        # aren't served each other's responses
+        self.cache_namespace: str = cache_namespace
+        # Seconds to wait for the connection and for each read of the response,
+        # None waits forever
+        self.timeout: Optional[float] = timeout
+        self.rate_limiter: Optional[TokenBucket] = (
+            TokenBucket(rate_limit, capacity=rate_limit) if rate_limit else None
+        )
+        self.session: requests.Session = self._create_session(
+            pool_size, max_retries, backoff_factor
+        )
+
+    def _create_session(
+        self, pool_size: int, max_retries: int, backoff_factor: float
+    ) -> requests.Session:
+        retry = _RateLimitedRetry(
+            total=max_retries,
+            backoff_factor=backoff_factor,
+            backoff_jitter=backoff_factor,
+            status_forcelist=constants.RETRY_STATUS_CODES,
+            allowed_methods=["GET"],
+            respect_retry_after_header=True,
+        )
+        retry.before_retry = self._acquire_rate_limit
+        adapter = HTTPAdapter(
+            pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry
+        )
+
+        session = requests.Session()
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        session.headers.update(
+            {
+                "apptoken": self.token,
+                "appPlatform": constants.APP_PLATFORM,
+                "appname": constants.APP_NAME,
+            }
+        )
+        return session
 
     def get_workout_history(
         self, from_track_id: Optional[int] = None
@@ -159,30 +338,195 @@ class Api:
         response = self._do_request(
             endpoint="/v1/sport/run/history.json",
             params={"trackid": from_track_id} if from_track_id is not None else {},
+            # New workouts keep appearing in the history, so it's only served from
+            # the cache when the network must not be used at all
+            use_cache=self.cache_only,
         )
-        model = WorkoutHistory(**response)
+        # Validating the raw bytes skips building the intermediate dict
+        model = WorkoutHistory.model_validate_json(response)
         return model
 
+    def check_token(self) -> bool:
+        """Returns whether the API accepts the token, with one history request."""
+        try:
+            self.get_workout_history()
+        except requests.HTTPError as e:
+            if (
+                e.response is not None
+                and e.response.status_code in constants.UNAUTHORIZED_STATUS_CODES
+            ):
+                return False
+            raise
+        return True
+
+    def iter_workout_history(self, prefetch: bool = True) -> Iterator[WorkoutHistory]:
+        """Yields the history pages starting from the newest workout. With prefetch
+        the next page is requested in the background while the caller processes the
+        current one."""
+        executor = ThreadPoolExecutor(max_workers=1) if prefetch else None
+        try:
+            history = self.get_workout_history()
+            while True:
+                next_page: Optional[Future] = None
+                if executor and history.data.next != -1:
+                    next_page = executor.submit(
+                        self.get_workout_history, from_track_id=history.data.next
+                    )
+
+                yield history
+
+                if history.data.next == -1:
+                    return
+                history = (
+                    next_page.result()
+                    if next_page
+                    else self.get_workout_history(from_track_id=history.data.next)
+                )
+        finally:
+            # The caller may stop before the last page, the prefetched one is dropped
+            if executor:
+                executor.shutdown(wait=False, cancel_futures=True)
+
     def get_workout_detail(self, workout: WorkoutSummary) -> WorkoutDetail:
-        response = self._do_request(
+        model = WorkoutDetail.model_validate_json(self.get_workout_detail_raw(workout))
+        return model
+
+    def get_workout_detail_raw(self, workout: WorkoutSummary) -> bytes:
+        """Returns the JSON of the detail, which is only validated where it's parsed
+        (see parse_points_json)."""
+        return self._do_request(
             endpoint="/v1/sport/run/detail.json",
             params={
                 "trackid": workout.trackid,
                 "source": workout.source,
             },
+            # The detail of a given workout version never changes
+            use_cache=True,
+            cache_key_params={"version": workout.version},
         )
-        model = WorkoutDetail(**response)
-        return model
 
-    def _do_request(self, endpoint: str, params: Dict[str, Any]) -> Dict[str, Any]:
-        response = requests.get(
-            urljoin(self.base_url, endpoint),
-            headers={
-                "apptoken": self.token,
-                "appPlatform": constants.APP_PLATFORM,
-                "appname": constants.APP_NAME,
+    def iter_workout_detail_raw(
+        self, workout: WorkoutSummary, chunk_size: int = 1 << 16
+    ) -> Generator[bytes, None, None]:
+        """Yields the JSON of the detail in chunks as it's downloaded, see
+        parse_points_stream."""
+        return self._stream_request(
+            endpoint="/v1/sport/run/detail.json",
+            params={
+                "trackid": workout.trackid,
+                "source": workout.source,
             },
-            params=params,
+            cache_key_params={"version": workout.version},
+            chunk_size=chunk_size,
         )
+
+    def _get_cache_key(
+        self,
+        endpoint: str,
+        params: Dict[str, Any],
+        cache_key_params: Optional[Dict[str, Any]],
+    ) -> Optional[str]:
+        if not self.cache:
+            return None
+        return self.cache.get_key(
+            urljoin(self.base_url, endpoint),
+            {**params, **(cache_key_params or {})},
+            namespace=self.cache_namespace,
+        )
+
+    def _acquire_rate_limit(self) -> None:
+        if self.rate_limiter:
+            with self.metrics.time("rate_limit_wait"):
+                self.rate_limiter.acquire()
+
+    def _send(
+        self, endpoint: str, params: Dict[str, Any], stream: bool = False
+    ) -> requests.Response:
+        # The retries acquire their own token, see _RateLimitedRetry
+        self._acquire_rate_limit()
+
+        with self.metrics.time("request"):
+            response = self.session.get(
+                urljoin(self.base_url, endpoint),
+                params=params,
+                stream=stream,
+                timeout=self.timeout,
+            )
+
+        # The retries done by urllib3 are recorded in the history of the response
+        if retries := getattr(response.raw, "retries", None):
+            self.metrics.increment("retries", len(retries.history))
+        self.metrics.increment("requests")
+        if not stream:
+            self.metrics.increment("bytes_downloaded", len(response.content))
+
+        if not response.ok:
+            self.metrics.increment("request_errors")
+            response.close()
         response.raise_for_status()
-        return response.json()
+        return response
+
+    def _do_request(
+        self,
+        endpoint: str,
+        params: Dict[str, Any],
+        use_cache: bool = False,
+        cache_key_params: Optional[Dict[str, Any]] = None,
+    ) -> bytes:
+        cache_key = self._get_cache_key(endpoint, params, cache_key_params)
+        if self.cache and cache_key:
+            if use_cache and (content := self.cache.get(cache_key)) is not None:
+                self.metrics.increment("cache_hits")
+                return content
+
+            if self.cache_only:
+                raise CacheMissError(f"{endpoint} {params} is not cached")
+
+        response = self._send(endpoint, params)
+
+        # Errors are answered with a 200 status too, they must not be served from
+        # the cache by the next runs
+        if self.cache and cache_key:
+            reader = _ResponseCodeReader()
+            reader.feed(response.content)
+            if reader.is_success():
+                self.cache.put(cache_key, response.content)
+
+        return response.content
+
+    def _stream_request(
+        self,
+        endpoint: str,
+        params: Dict[str, Any],
+        cache_key_params: Optional[Dict[str, Any]] = None,
+        chunk_size: int = 1 << 16,
+    ) -> Generator[bytes, None, None]:
+        cache_key = self._get_cache_key(endpoint, params, cache_key_params)
+        if self.cache and cache_key:
+            if (content := self.cache.get(cache_key)) is not None:
+                self.metrics.increment("cache_hits")
+                yield content
+                return
+
+            if self.cache_only:
+                raise CacheMissError(f"{endpoint} {params} is not cached")
+
+        # The response is compressed for the cache while it's streamed, so it's
+        # never held uncompressed as a whole
+        compressor = zlib.compressobj() if self.cache and cache_key else None
+        compressed = []
+        reader = _ResponseCodeReader()
+
+        with self._send(endpoint, params, stream=True) as response:
+            for chunk in response.iter_content(chunk_size):
+                self.metrics.increment("bytes_downloaded", len(chunk))
+                if compressor:
+                    compressed.append(compressor.compress(chunk))
+                    reader.feed(chunk)
+                yield chunk
+
+        # Checked before the consumer validates the detail, which only happens
+        # once the last chunk was taken
+        if self.cache and cache_key and compressor and reader.is_success():
+            compressed.append(compressor.flush())
+            self.cache.put_compressed(cache_key, b"".join(compressed))
@@ -0,0 +1,277 @@
+import array
+import bisect
+import csv
+import io
+import json
+import logging
+import zipfile
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Generator, Iterator, List, Optional
+
+from src import constants
+from src.api import (
+    WorkoutDetail,
+    WorkoutDetailData,
+    WorkoutHistory,
+    WorkoutHistoryData,
+    WorkoutSummary,
+)
+from src.exporters.base_exporter import NO_VALUE
+from src.metrics import Metrics
+
+LOGGER = logging.getLogger(__name__)
+
+# Source of the workouts read from an archive, so their sync state doesn't clash
+# with the ones downloaded from the API
+ARCHIVE_SOURCE = "gdpr-export"
+
+# Normalized names (lower case, without units and separators) of the columns which
+# identify the tables of the archive, matched against every CSV header
+SUMMARY_COLUMNS = {"starttime", "sporttime", "distance"}
+POINT_COLUMNS = {"trackid", "latitude", "longitude"}
+TIME_COLUMNS = ("timestamp", "time")
+ALTITUDE_COLUMNS = ("altitude", "alt")
+HEART_RATE_COLUMNS = ("heartrate", "hr")
+
+
+def _normalize_column(name: str) -> str:
+    # e.g. "sportTime(s)" -> "sporttime", "track_id" -> "trackid"
+    name = name.split("(")[0].strip().lower()
+    return name.replace("_", "").replace(" ", "")
+
+
+def _parse_time(value: str) -> int:
+    """Returns the Unix time of an epoch (in seconds or milliseconds) or ISO date,
+    dates without a time zone are in UTC."""
+    if value.isdigit():
+        time = int(value)
+        return time // 1000 if time > 100000000000 else time
+
+    date = datetime.fromisoformat(value)
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=timezone.utc)
+    return int(date.timestamp())
+
+
+def _get(row: Dict[str, str], columns) -> str:
+    return next((row[column] for column in columns if row.get(column)), "")
+
+
+class _ArchiveTrack:
+    """Samples of one workout, collected while the point tables are read."""
+
+    __slots__ = ("times", "lat", "lon", "alt", "hr_times", "hr")
+
+    def __init__(self):
+        self.times = array.array("q")
+        self.lat = array.array("q")
+        self.lon = array.array("q")
+        self.alt = array.array("q")
+        self.hr_times = array.array("q")
+        self.hr = array.array("q")
+
+    def add(self, row: Dict[str, str]) -> None:
+        time = _parse_time(_get(row, TIME_COLUMNS))
+        if row.get("latitude") and row.get("longitude"):
+            altitude = _get(row, ALTITUDE_COLUMNS)
+            self.times.append(time)
+            self.lat.append(round(float(row["latitude"]) * 100000000))
+            self.lon.append(round(float(row["longitude"]) * 100000000))
+            self.alt.append(round(float(altitude) * 100) if altitude else NO_VALUE)
+        if heart_rate := _get(row, HEART_RATE_COLUMNS):
+            self.hr_times.append(time)
+            self.hr.append(round(float(heart_rate)))
+
+    def get_detail_fields(self, start_time: int) -> Dict[str, str]:
+        """Encodes the samples like the API does: times, coordinates and heart rates
+        are deltas of the previous sample, the first time is relative to the start
+        of the workout."""
+        points = sorted(zip(self.times, self.lat, self.lon, self.alt))
+        heart_rates = sorted(zip(self.hr_times, self.hr))
+
+        times = []
+        coordinates = []
+        previous = (start_time, 0, 0)
+        for time, lat, lon, _ in points:
+            times.append(str(time - previous[0]))
+            coordinates.append(f"{lat - previous[1]},{lon - previous[2]}")
+            previous = (time, lat, lon)
+
+        heart_rate = []
+        previous = (start_time, 0)
+        for time, value in heart_rates:
+            heart_rate.append(f"{time - previous[0]},{value - previous[1]}")
+            previous = (time, value)
+
+        return {
+            "time": ";".join(times),
+            "longitude_latitude": ";".join(coordinates),
+            "altitude": ";".join(str(point[3]) for point in points),
+            "heart_rate": ";".join(heart_rate),
+        }
+
+
+class ArchiveApi:
+    """Serves the workouts of a Zepp/Mi Fit data export archive (the ZIP file of the
+    GDPR page) in place of Api, so a whole history is exported without a request.
+
+    The CSV tables of the archive are streamed out of the ZIP file once, without
+    extracting it. The workout summaries come from the sport table, the track
+    points from any table with trackid, latitude and longitude columns. Workouts
+    whose points aren't in the archive are skipped as workouts without points.
+
+    All the summaries and points are read into memory by __init__, as the points of
+    a workout may be spread over several tables. A point takes up to 48 bytes, so
+    an archive of 10 million points needs about 500 MB.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        password: Optional[str] = None,
+        page_size: int = 100,
+        metrics: Optional[Metrics] = None,
+    ):
+        self.path: Path = path
+        self.page_size: int = max(page_size, 1)
+        self.metrics: Metrics = metrics or Metrics()
+        # Newest first, like the history served by the API
+        self.summaries: List[WorkoutSummary] = []
+        self.tracks: Dict[str, _ArchiveTrack] = {}
+
+        with zipfile.ZipFile(path) as archive:
+            if password:
+                archive.setpassword(password.encode())
+            for info in archive.infolist():
+                if not info.is_dir() and info.filename.lower().endswith(".csv"):
+                    self._read_table(archive, info)
+
+        self.summaries.sort(key=lambda summary: int(summary.trackid), reverse=True)
+        # Negated, so the position of a track id can be bisected
+        self._start_times: List[int] = [
+            -int(summary.trackid) for summary in self.summaries
+        ]
+        LOGGER.info(
+            f"Read {len(self.summaries)} workouts, {len(self.tracks)} of them with "
+            f"points, from {path}"
+        )
+
+    def _read_table(self, archive: zipfile.ZipFile, info: zipfile.ZipInfo) -> None:
+        with archive.open(info) as fp:
+            reader = csv.reader(io.TextIOWrapper(fp, encoding="utf-8-sig"))
+            header = [_normalize_column(column) for column in next(reader, [])]
+
+            if POINT_COLUMNS.issubset(header):
+                # Every row would be invalid, so the table is skipped at once
+                if not any(column in header for column in TIME_COLUMNS):
+                    LOGGER.warning(
+                        f"Skipping {info.filename}, it has no timestamp column"
+                    )
+                    return
+                read_row = self._read_point
+            elif SUMMARY_COLUMNS.issubset(header):
+                read_row = self._read_summary
+            else:
+                return
+
+            LOGGER.info(f"Reading {info.filename}")
+            invalid_rows = 0
+            for values in reader:
+                if not values:
+                    continue
+                try:
+                    read_row(dict(zip(header, values)))
+                except ValueError:
+                    invalid_rows += 1
+            if invalid_rows:
+                LOGGER.warning(
+                    f"Skipped {invalid_rows} invalid rows of {info.filename}"
+                )
+            self.metrics.increment("archive_bytes_read", info.file_size)
+
+    def _read_summary(self, row: Dict[str, str]) -> None:
+        start_time = _parse_time(row.get("trackid") or row["starttime"])
+        run_time = int(float(row["sporttime"] or 0))
+        self.summaries.append(
+            WorkoutSummary(
+                trackid=str(start_time),
+                source=ARCHIVE_SOURCE,
+                dis=row["distance"] or "0",
+                calorie=row.get("calories", ""),
+                end_time=str(start_time + run_time),
+                run_time=str(run_time),
+                avg_pace=row.get("avgpace", ""),
+                avg_frequency="",
+                avg_heart_rate="",
+                type=int(row.get("type") or 0),
+                location="",
+                city="",
+                forefoot_ratio="",
+                bind_device="",
+                max_pace=float(row["maxpace"]) if row.get("maxpace") else None,
+                min_pace=float(row["minpace"]) if row.get("minpace") else None,
+                version=0,
+                app_name=constants.APP_NAME,
+            )
+        )
+
+    def _read_point(self, row: Dict[str, str]) -> None:
+        track_id = str(_parse_time(row["trackid"]))
+        if (track := self.tracks.get(track_id)) is None:
+            track = self.tracks[track_id] = _ArchiveTrack()
+        track.add(row)
+
+    def get_workout_history(
+        self, from_track_id: Optional[int] = None
+    ) -> WorkoutHistory:
+        start = (
+            bisect.bisect_left(self._start_times, -from_track_id)
+            if from_track_id is not None
+            else 0
+        )
+        end = start + self.page_size
+        return WorkoutHistory(
+            code=1,
+            message="success",
+            data=WorkoutHistoryData(
+                next=(
+                    int(self.summaries[end].trackid)
+                    if end < len(self.summaries)
+                    else -1
+                ),
+                summary=self.summaries[start:end],
+            ),
+        )
+
+    def iter_workout_history(self, prefetch: bool = True) -> Iterator[WorkoutHistory]:
+        history = self.get_workout_history()
+        yield history
+        while history.data.next != -1:
+            history = self.get_workout_history(from_track_id=history.data.next)
+            yield history
+
+    def get_workout_detail(self, workout: WorkoutSummary) -> WorkoutDetail:
+        return WorkoutDetail.model_validate_json(self.get_workout_detail_raw(workout))
+
+    def iter_workout_detail_raw(
+        self, workout: WorkoutSummary, chunk_size: int = 1 << 16
+    ) -> Generator[bytes, None, None]:
+        yield self.get_workout_detail_raw(workout)
+
+    def get_workout_detail_raw(self, workout: WorkoutSummary) -> bytes:
+        """Returns the detail in the JSON format of the API, so it's parsed by the
+        same code as the downloaded ones."""
+        track = self.tracks.get(workout.trackid)
+        fields = {
+            **{
+                field: ""
+                for field, info in WorkoutDetailData.model_fields.items()
+                if info.annotation is str
+            },
+            **(track.get_detail_fields(int(workout.trackid)) if track else {}),
+            "trackid": int(workout.trackid),
+            "source": workout.source,
+            "version": workout.version,
+        }
+        return json.dumps({"code": 1, "message": "success", "data": fields}).encode()
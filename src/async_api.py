@@ -0,0 +1,205 @@
+import asyncio
+import random
+from importlib.util import find_spec
+from typing import Any, AsyncIterator, Dict, Optional
+from urllib.parse import urljoin, urlparse
+
+from src import constants
+from src.api import WorkoutDetail, WorkoutHistory, WorkoutSummary
+from src.metrics import Metrics
+
+try:
+    import httpx
+except ImportError as e:
+    raise ImportError("AsyncApi requires httpx, install it with the async extra") from e
+
+
+class AsyncSession:
+    """The httpx client and the per host limits of one or more AsyncApi, so the
+    AsyncApi of several accounts share their connections and their limits.
+
+    Connections are reused across requests, over HTTP/2 when the h2 package is
+    installed, and at most max_connections_per_host requests are in flight to a
+    host at once.
+    """
+
+    def __init__(
+        self,
+        max_connections: int = 100,
+        max_connections_per_host: int = 20,
+        timeout: float = 60.0,
+    ):
+        self.max_connections_per_host: int = max(max_connections_per_host, 1)
+        self._host_limits: Dict[str, asyncio.Semaphore] = {}
+        # The token is sent with every request, as it differs between accounts
+        self.client = httpx.AsyncClient(
+            http2=find_spec("h2") is not None,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+            ),
+            timeout=timeout,
+            headers={
+                "appPlatform": constants.APP_PLATFORM,
+                "appname": constants.APP_NAME,
+            },
+        )
+
+    async def __aenter__(self) -> "AsyncSession":
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        await self.client.aclose()
+
+    def get_host_limit(self, url: str) -> asyncio.Semaphore:
+        host = urlparse(url).netloc
+        if (semaphore := self._host_limits.get(host)) is None:
+            semaphore = self._host_limits[host] = asyncio.Semaphore(
+                self.max_connections_per_host
+            )
+        return semaphore
+
+
+class AsyncApi:
+    """asyncio counterpart of Api built on httpx.
+
+    Thousands of detail requests can be awaited concurrently without a thread
+    each, bounded by the limits of the session. Without a session, the AsyncApi
+    opens its own and closes it with aclose. Cancelling a task cancels its pending
+    request.
+    """
+
+    def __init__(
+        self,
+        endpoint: str,
+        token: str,
+        max_connections: int = 100,
+        max_connections_per_host: int = 20,
+        max_retries: int = 5,
+        backoff_factor: float = 0.5,
+        timeout: float = 60.0,
+        metrics: Optional[Metrics] = None,
+        session: Optional[AsyncSession] = None,
+    ):
+        self.base_url: str = endpoint
+        self.token: str = token
+        self.max_retries: int = max_retries
+        self.backoff_factor: float = backoff_factor
+        self.metrics: Metrics = metrics or Metrics()
+        self._owns_session: bool = session is None
+        self.session: AsyncSession = session or AsyncSession(
+            max_connections, max_connections_per_host, timeout
+        )
+
+    async def __aenter__(self) -> "AsyncApi":
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        if self._owns_session:
+            await self.session.aclose()
+
+    async def get_workout_history(
+        self, from_track_id: Optional[int] = None
+    ) -> WorkoutHistory:
+        response = await self._do_request(
+            endpoint="/v1/sport/run/history.json",
+            params={"trackid": from_track_id} if from_track_id is not None else {},
+        )
+        model = WorkoutHistory.model_validate_json(response)
+        return model
+
+    async def iter_workout_history(
+        self, prefetch: bool = True
+    ) -> AsyncIterator[WorkoutHistory]:
+        """Yields the history pages starting from the newest workout, the next page
+        is requested while the caller processes the current one."""
+        history = await self.get_workout_history()
+        next_page: Optional[asyncio.Task[WorkoutHistory]] = None
+        try:
+            while True:
+                if prefetch and history.data.next != -1:
+                    next_page = asyncio.create_task(
+                        self.get_workout_history(from_track_id=history.data.next)
+                    )
+
+                yield history
+
+                if history.data.next == -1:
+                    return
+                if next_page is not None:
+                    history = await next_page
+                    next_page = None
+                else:
+                    history = await self.get_workout_history(
+                        from_track_id=history.data.next
+                    )
+        finally:
+            if next_page:
+                next_page.cancel()
+
+    async def get_workout_detail(self, workout: WorkoutSummary) -> WorkoutDetail:
+        response = await self.get_workout_detail_raw(workout)
+        model = WorkoutDetail.model_validate_json(response)
+        return model
+
+    async def get_workout_detail_raw(self, workout: WorkoutSummary) -> bytes:
+        return await self._do_request(
+            endpoint="/v1/sport/run/detail.json",
+            params={
+                "trackid": workout.trackid,
+                "source": workout.source,
+            },
+        )
+
+    def _get_backoff(self, attempt: int, response: Optional[Any]) -> float:
+        if response is not None and (
+            retry_after := response.headers.get("Retry-After")
+        ):
+            try:
+                return float(retry_after)
+            except ValueError:
+                pass
+        # Same schedule as urllib3 uses for Api
+        backoff = self.backoff_factor * (2**attempt)
+        return backoff + random.uniform(0, self.backoff_factor)
+
+    async def _get(self, url: str, params: Dict[str, Any]) -> "httpx.Response":
+        async with self.session.get_host_limit(url):
+            with self.metrics.time("request"):
+                response = await self.session.client.get(
+                    url, params=params, headers={"apptoken": self.token}
+                )
+        self.metrics.increment("requests")
+        self.metrics.increment("bytes_downloaded", len(response.content))
+        return response
+
+    def _check_response(self, response: "httpx.Response") -> bytes:
+        if response.is_error:
+            self.metrics.increment("request_errors")
+        response.raise_for_status()
+        return response.content
+
+    async def _do_request(self, endpoint: str, params: Dict[str, Any]) -> bytes:
+        url = urljoin(self.base_url, endpoint)
+
+        for attempt in range(self.max_retries):
+            response = None
+            try:
+                response = await self._get(url, params)
+            except httpx.TransportError:
+                pass
+            else:
+                if response.status_code not in constants.RETRY_STATUS_CODES:
+                    return self._check_response(response)
+
+            self.metrics.increment("retries")
+            await asyncio.sleep(self._get_backoff(attempt, response))
+
+        # The errors of the last attempt are raised
+        return self._check_response(await self._get(url, params))
@@ -0,0 +1,96 @@
+import asyncio
+import logging
+from typing import AsyncIterator, Iterable, List
+
+from src.api import WorkoutSummary
+from src.async_api import AsyncApi
+from src.scraper import BaseScraper
+
+LOGGER = logging.getLogger(__name__)
+
+
+class AsyncScraper(BaseScraper[AsyncApi]):
+    """Scraper driven by an event loop, the details are awaited on the AsyncApi
+    while parsing and writing run in worker threads (and the parse processes).
+
+    workers bounds the number of workouts being exported at once.
+    """
+
+    async def iter_workout_summaries_async(self) -> AsyncIterator[WorkoutSummary]:
+        count = 0
+        selected = 0
+        self.start_paging()
+
+        async for history in self.api.iter_workout_history():
+            page_synced = self.is_page_synced(history)
+            summaries, done = self.select_summaries(history, selected)
+
+            count += len(history.data.summary)
+            selected += len(summaries)
+            for summary in summaries:
+                yield summary
+
+            if history.data.next == -1 or done:
+                self.end_paging()
+                break
+            if page_synced:
+                logging.info("Reached already synced workouts, stopping pagination")
+                self.end_paging()
+                break
+
+        logging.info(f"There are {count} workouts in total, {selected} selected")
+
+    async def export_workout_async(self, summary: WorkoutSummary) -> None:
+        with self.metrics.time("fetch"):
+            detail = await self.api.get_workout_detail_raw(summary)
+
+        if track := await asyncio.to_thread(self.parse_detail, summary, detail):
+            await asyncio.to_thread(self.write_track, summary, track)
+
+    async def run_async(self) -> None:
+        self.open_outputs()
+
+        count = 0
+        failed = 0
+        # Acquired before a workout is scheduled, so the history isn't read further
+        # than the workouts being exported. Profiles need one workout at a time.
+        slots = asyncio.Semaphore(1 if self.profiler else self.workers)
+
+        async def export(summary: WorkoutSummary):
+            nonlocal failed
+            try:
+                await self.export_workout_async(summary)
+            except Exception:
+                failed += 1
+                self.record_failure(summary)
+                LOGGER.exception(f"Failed to export workout {summary.trackid}")
+            finally:
+                slots.release()
+
+        try:
+            with self.create_parse_pool() as self._parse_pool:
+                async with asyncio.TaskGroup() as tasks:
+                    async for summary in self.iter_workout_summaries_async():
+                        if self.is_synced(summary):
+                            continue
+                        count += 1
+                        await slots.acquire()
+                        tasks.create_task(export(summary))
+            self.update_watermark(failed)
+        finally:
+            self._parse_pool = None
+            self.close_outputs()
+
+        self.log_results(count, failed)
+
+
+async def run_scrapers(scrapers: Iterable[AsyncScraper]) -> List[BaseException]:
+    """Runs the scrapers of several accounts concurrently in the current event loop
+    and returns the errors of the ones which failed."""
+    results = await asyncio.gather(
+        *(scraper.run_async() for scraper in scrapers), return_exceptions=True
+    )
+    errors = [result for result in results if isinstance(result, BaseException)]
+    for error in errors:
+        LOGGER.error(f"Scraper failed: {error!r}")
+    return errors
@@ -1,13 +1,64 @@
 import logging
+import os
+import time
+from pathlib import Path
 from typing import Optional
 
 from furl import furl
-from install_playwright import install
+from pydantic import BaseModel
 
 from src import constants
 
 _logger = logging.getLogger(__name__)
 
+DEFAULT_TOKEN_CACHE_PATH = (
+    Path(os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache")
+    / "mifit-exporter"
+    / "token.json"
+)
+
+
+class CachedToken(BaseModel):
+    token: str
+    # Expiry of the apptoken cookie, None for a session cookie
+    expires_at: Optional[float] = None
+
+
+class TokenCache:
+    """Keeps the app token between runs, so the browser is only opened again once
+    the token has expired or was rejected by the API."""
+
+    def __init__(self, path: Path = DEFAULT_TOKEN_CACHE_PATH):
+        self.path: Path = path
+
+    def load(self) -> Optional[str]:
+        if not self.path.exists():
+            return None
+
+        try:
+            cached = CachedToken.model_validate_json(self.path.read_bytes())
+        except ValueError:
+            _logger.warning(f"Ignoring the invalid token cache {self.path}")
+            return None
+
+        if cached.expires_at is not None and cached.expires_at <= time.time():
+            _logger.info("The cached token has expired")
+            return None
+        return cached.token
+
+    def save(self, token: str, expires_at: Optional[float] = None) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # The token grants access to the account, so only the user can read it. The
+        # mode of open only applies to a new file, an existing one is truncated
+        # and restricted before the token is written.
+        fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w") as fp:
+            os.chmod(self.path, 0o600)
+            fp.write(CachedToken(token=token, expires_at=expires_at).model_dump_json())
+
+    def clear(self) -> None:
+        self.path.unlink(missing_ok=True)
+
 
 def _get_gdpr_url() -> str:
     return furl(
@@ -19,8 +70,10 @@ def _get_gdpr_url() -> str:
     ).url
 
 
-def get_app_token() -> Optional[str]:
+def get_app_token(token_cache: Optional[TokenCache] = None) -> Optional[str]:
+    # Imported here, as they are only needed when the token isn't provided
     try:
+        from install_playwright import install
         from playwright.sync_api import sync_playwright
     except ImportError:
         _logger.error(
@@ -57,4 +110,11 @@ def get_app_token() -> Optional[str]:
             return None
 
         browser.close()
-        return token_cookie.get("value")
+
+        token = token_cookie.get("value")
+        if token_cache and token:
+            # Session cookies have an expiry of -1
+            expires = token_cookie.get("expires")
+            token_cache.save(token, expires if expires and expires > 0 else None)
+            _logger.info(f"Token saved to {token_cache.path}")
+        return token
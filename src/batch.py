@@ -0,0 +1,127 @@
+import json
+import logging
+import threading
+from pathlib import Path
+from typing import Callable, Dict, List
+
+from pydantic import BaseModel
+
+from src.job_queue import Job, JobQueue
+from src.scraper import Scraper
+
+LOGGER = logging.getLogger(__name__)
+
+
+class Account(BaseModel):
+    token: str
+    output_directory: Path
+    # Identifies the account in the job queue, defaults to the output directory
+    name: str = ""
+
+    def get_name(self) -> str:
+        return self.name or str(self.output_directory)
+
+
+def load_accounts(path: Path) -> List[Account]:
+    """Reads a JSON list of {"token": ..., "output_directory": ..., "name": ...}."""
+    accounts = [Account(**value) for value in json.loads(path.read_text())]
+    names = [account.get_name() for account in accounts]
+    assert len(set(names)) == len(names), "Account names must be unique"
+    return accounts
+
+
+class BatchRunner:
+    """Exports the workouts of several accounts, with their progress recorded in a
+    JobQueue, so a killed run can be resumed without downloading anything twice.
+
+    Every account has its own Scraper, the workers take jobs of the accounts in
+    turns.
+    """
+
+    def __init__(
+        self,
+        accounts: List[Account],
+        create_scraper: Callable[[Account], Scraper],
+        job_queue: JobQueue,
+        workers: int = 4,
+    ):
+        self.job_queue: JobQueue = job_queue
+        self.workers: int = max(workers, 1)
+        self.scrapers: Dict[str, Scraper] = {
+            account.get_name(): create_scraper(account) for account in accounts
+        }
+
+        for name in self.scrapers:
+            self.job_queue.add_account(name)
+
+    def queue_workouts(self, name: str) -> None:
+        scraper = self.scrapers[name]
+        history_done, next_track_id = self.job_queue.get_history_position(name)
+
+        # Resumes paging from the last page which was stored completely. The limit
+        # of the filter counts the workouts selected since then.
+        selected = 0
+        while not history_done:
+            history = scraper.api.get_workout_history(from_track_id=next_track_id)
+            summaries, done = scraper.select_summaries(history, selected)
+            next_track_id = -1 if done else history.data.next
+            added = self.job_queue.add_page(name, summaries, next_track_id)
+            LOGGER.info(f"{name}: queued {added} new or changed workouts")
+
+            selected += len(summaries)
+            history_done = next_track_id == -1
+
+    def process(self, job: Job) -> None:
+        scraper = self.scrapers[job.account]
+
+        # The detail of a workout fetched by an interrupted run is stored in the queue
+        if (detail := self.job_queue.get_detail(job)) is None:
+            detail = scraper.fetch_detail(job.summary)
+            self.job_queue.mark_fetched(job, detail)
+
+        if track := scraper.parse_detail(job.summary, detail):
+            scraper.write_track(job.summary, track)
+        self.job_queue.mark_exported(job)
+
+    def work(self) -> None:
+        while job := self.job_queue.claim():
+            try:
+                self.process(job)
+            except Exception as e:
+                scraper = self.scrapers[job.account]
+                scraper.metrics.increment("workouts_failed")
+                LOGGER.exception(
+                    f"{job.account}: failed to export workout {job.summary.trackid}"
+                )
+                self.job_queue.mark_failed(job, repr(e))
+
+    def run(self) -> None:
+        self.job_queue.start_run()
+
+        for name in self.scrapers:
+            try:
+                self.queue_workouts(name)
+            except Exception:
+                LOGGER.exception(f"{name}: failed to fetch the workout history")
+
+        for scraper in self.scrapers.values():
+            scraper.open_outputs()
+
+        try:
+            threads = [
+                threading.Thread(target=self.work, name=f"batch-{i}")
+                for i in range(self.workers)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            for scraper in self.scrapers.values():
+                scraper.close_outputs()
+
+        for name, states in self.job_queue.get_stats().items():
+            LOGGER.info(
+                f"{name}: "
+                + ", ".join(f"{count} {state}" for state, count in states.items())
+            )
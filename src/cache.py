@@ -0,0 +1,107 @@
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+import zlib
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+LOGGER = logging.getLogger(__name__)
+
+
+class CacheMissError(Exception):
+    pass
+
+
+class ResponseCache:
+    """Size-bounded LRU store of compressed API responses, kept in a SQLite file."""
+
+    FILE_NAME = "responses.sqlite3"
+
+    def __init__(self, cache_dir: Path, max_size: Optional[int] = None):
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_size: Optional[int] = max_size
+        self.hits: int = 0
+        self.misses: int = 0
+        self._lock = threading.Lock()
+        self._con = sqlite3.connect(cache_dir / self.FILE_NAME, check_same_thread=False)
+        self._con.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, "
+            "data BLOB NOT NULL, "
+            "size INTEGER NOT NULL, "
+            "accessed_at REAL NOT NULL)"
+        )
+        self._con.execute(
+            "CREATE INDEX IF NOT EXISTS responses_accessed_at "
+            "ON responses (accessed_at)"
+        )
+        self._con.commit()
+
+    @staticmethod
+    def get_key(endpoint: str, params: Dict[str, Any], namespace: str = "") -> str:
+        return hashlib.sha256(
+            json.dumps(
+                [namespace, endpoint, params], sort_keys=True, default=str
+            ).encode()
+        ).hexdigest()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            row = self._con.execute(
+                "SELECT data FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+
+            if row is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self._con.execute(
+                "UPDATE responses SET accessed_at = ? WHERE key = ?",
+                (time.time(), key),
+            )
+            self._con.commit()
+
+        return zlib.decompress(row[0])
+
+    def put(self, key: str, content: bytes) -> None:
+        self.put_compressed(key, zlib.compress(content))
+
+    def put_compressed(self, key: str, data: bytes) -> None:
+        """Stores a response compressed by the caller with zlib, e.g. while it was
+        streamed."""
+        with self._lock:
+            self._con.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)",
+                (key, data, len(data), time.time()),
+            )
+            self._evict()
+            self._con.commit()
+
+    def _evict(self) -> None:
+        if self.max_size is None:
+            return
+
+        (total_size,) = self._con.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()
+
+        for key, size in self._con.execute(
+            "SELECT key, size FROM responses ORDER BY accessed_at"
+        ).fetchall():
+            if total_size <= self.max_size:
+                break
+            self._con.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total_size -= size
+
+    def get_stats(self) -> str:
+        total = self.hits + self.misses
+        ratio = self.hits / total if total else 0
+        return f"{self.hits} hits, {self.misses} misses ({ratio:.0%} hit ratio)"
+
+    def close(self) -> None:
+        with self._lock:
+            self._con.close()
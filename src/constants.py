@@ -1,4 +1,26 @@
-from typing import Final
+from typing import Dict, Final, Tuple
 
 APP_NAME: Final[str] = "com.xiaomi.hm.health"
 APP_PLATFORM: Final[str] = "web"
+RETRY_STATUS_CODES: Final[Tuple[int, ...]] = (429, 500, 502, 503, 504)
+UNAUTHORIZED_STATUS_CODES: Final[Tuple[int, ...]] = (401, 403)
+# Code of the API responses which carry their data
+SUCCESS_CODE: Final[int] = 1
+
+WORKOUT_TYPE_MAP: Final[Dict[int, str]] = {
+    1: "running",
+    6: "walking",
+    8: "treadmill_running",
+    9: "cycling",
+    10: "indoor_cycling",
+    16: "other",
+    23: "indoor_rowing",
+    92: "badminton",
+}
+# Workout types recorded without GPS, their details never have any points
+INDOOR_WORKOUT_TYPE_NAMES: Final[Tuple[str, ...]] = (
+    "treadmill_running",
+    "indoor_cycling",
+    "indoor_rowing",
+    "badminton",
+)
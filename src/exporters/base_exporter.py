@@ -2,20 +2,35 @@
 # Based on https://github.com/mireq/MiFitDataExport
 import abc
 import array
-from bisect import bisect_left
+import functools
+import heapq
+import warnings
 from collections import namedtuple
 from datetime import datetime
-from itertools import accumulate
+from itertools import accumulate, chain
 from pathlib import Path
 from typing import List, Optional
 
 from pydantic import BaseModel
 
-from src.api import WorkoutDetailData, WorkoutSummary
+from src.api import WorkoutDetail, WorkoutDetailData, WorkoutSummary
+
 
 NO_VALUE = -2000000
 FIX_BIP_GAPS = False
 
+
+@functools.cache
+def get_numpy():
+    """Imports NumPy on first use, so starting the exporter doesn't pay for it.
+    Returns None when it isn't installed."""
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
 RawTrackData = namedtuple(
     "RawTrackData",
     [
@@ -34,24 +49,6 @@ RawTrackData = namedtuple(
         "cadence",
     ],
 )
-Position = namedtuple("Position", ["lat", "lon", "alt"])
-TrackPoint = namedtuple("TrackPoint", ["time", "position", "hr", "stride", "cadence"])
-
-
-class Interpolate(object):
-    def __init__(self, x_list, y_list):
-        intervals = zip(x_list, x_list[1:], y_list, y_list[1:])
-        self.x_list = x_list
-        self.y_list = y_list
-        self.slopes = [(y2 - y1) // ((x2 - x1) or 1) for x1, x2, y1, y2 in intervals]
-
-    def __getitem__(self, x):
-        i = bisect_left(self.x_list, x) - 1
-        if i >= len(self.slopes):
-            return self.y_list[-1]
-        if i < 0:
-            return self.y_list[0]
-        return self.y_list[i] + self.slopes[i] * (x - self.x_list[i])
 
 
 class ExportablePoint(BaseModel):
@@ -61,13 +58,129 @@ class ExportablePoint(BaseModel):
     altitude: Optional[float]
     heart_rate: Optional[float]
     cadence: Optional[float]
+    stride: Optional[float] = None
 
 
-def parse_track_data(summary: WorkoutSummary, detail: WorkoutDetailData):
+class ExportableTrack(object):
+    """Columnar representation of a track, every column is a typed array with one
+    entry per point. Times are UTC seconds since the epoch."""
+
+    __slots__ = (
+        "time",
+        "latitude",
+        "longitude",
+        "altitude",
+        "heart_rate",
+        "cadence",
+        "stride",
+    )
+
+    def __init__(
+        self, time, latitude, longitude, altitude, heart_rate, cadence, stride
+    ):
+        self.time = time
+        self.latitude = latitude
+        self.longitude = longitude
+        self.altitude = altitude
+        self.heart_rate = heart_rate
+        self.cadence = cadence
+        self.stride = stride
+
+    @classmethod
+    def empty(cls):
+        return cls(*([array.array("q")] + [array.array("d") for _ in range(6)]))
+
+    def __len__(self):
+        return len(self.time)
+
+    def __iter__(self):
+        # Row view for exporters working point by point, the values are trusted
+        # so the points are constructed without validation
+        for time, latitude, longitude, altitude, heart_rate, cadence, stride in zip(
+            self.time,
+            self.latitude,
+            self.longitude,
+            self.altitude,
+            self.heart_rate,
+            self.cadence,
+            self.stride,
+        ):
+            yield ExportablePoint.model_construct(
+                time=datetime.utcfromtimestamp(time),
+                latitude=latitude,
+                longitude=longitude,
+                altitude=altitude,
+                heart_rate=heart_rate,
+                cadence=cadence,
+                stride=stride,
+            )
+
+
+def parse_numpy_columns(text: str, min_columns: int, empty_first: Optional[int] = None):
+    """Parses a "a,b,...;a,b,...;" string into an int64 matrix with one conversion
+    over the whole buffer instead of splitting it row by row."""
+    np = get_numpy()
+    text = text.strip(";")
+    if not text:
+        return np.empty((0, min_columns), dtype=np.int64)
+
+    if empty_first is not None:
+        text = f";{text}".replace(";,", f";{empty_first},")[1:]
+
+    rows = text.count(";") + 1
+    first_row_end = text.find(";")
+    columns = text[: first_row_end if first_row_end != -1 else None].count(",") + 1
+    if columns < min_columns or text.count(",") != rows * (columns - 1):
+        raise ValueError("Inconsistent number of columns")
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", DeprecationWarning)
+        values = np.fromstring(text.replace(";", ","), dtype=np.int64, sep=",")
+
+    # fromstring stops silently at the first token which isn't an integer
+    if values.size != rows * columns:
+        raise ValueError("Couldn't parse every value")
+
+    return values.reshape(rows, columns)
+
+
+def _to_array(values, typecode="q"):
+    np = get_numpy()
+    data = array.array(typecode)
+    dtype = np.int64 if typecode == "q" else np.float64
+    data.frombytes(np.ascontiguousarray(values, dtype=dtype).tobytes())
+    return data
+
+
+def _parse_track_data_numpy(summary: WorkoutSummary, detail: WorkoutDetailData):
+    times = parse_numpy_columns(detail.time, 1)
+    lat_lon = parse_numpy_columns(detail.longitude_latitude, 2)
+    alt = parse_numpy_columns(detail.altitude, 1)
+    hr = parse_numpy_columns(detail.heart_rate, 2, empty_first=1)
+    gait = parse_numpy_columns(detail.gait, 4)
+
+    return RawTrackData(
+        start_time=int(summary.trackid),
+        end_time=int(summary.end_time),
+        cost_time=int(float(summary.run_time or -1)),
+        distance=float(summary.dis),
+        times=_to_array(times[:, 0]),
+        lat=_to_array(lat_lon[:, 0]),
+        lon=_to_array(lat_lon[:, 1]),
+        alt=_to_array(alt[:, 0]),
+        hrtimes=_to_array(hr[:, 0]),
+        hr=_to_array(hr[:, 1]),
+        steptimes=_to_array(gait[:, 0]),
+        stride=_to_array(gait[:, 2]),
+        cadence=_to_array(gait[:, 3]),
+    )
+
+
+def _parse_track_data_python(summary: WorkoutSummary, detail: WorkoutDetailData):
     return RawTrackData(
         start_time=int(summary.trackid),
         end_time=int(summary.end_time),
-        cost_time=-1,
+        cost_time=int(float(summary.run_time or -1)),
         distance=float(summary.dis),
         times=array.array(
             "q",
@@ -147,8 +260,17 @@ def parse_track_data(summary: WorkoutSummary, detail: WorkoutDetailData):
     )
 
 
-def interpolate_column(data, original_points, new_points):
-    data = array.array("q", data)
+def parse_track_data(summary: WorkoutSummary, detail: WorkoutDetailData):
+    if get_numpy() is not None:
+        try:
+            return _parse_track_data_numpy(summary, detail)
+        except ValueError:
+            pass
+
+    return _parse_track_data_python(summary, detail)
+
+
+def _fill_missing_values(data):
     old_value = NO_VALUE
     for old_value in data:
         if old_value != NO_VALUE:
@@ -158,101 +280,218 @@ def interpolate_column(data, original_points, new_points):
             data[i] = old_value
         else:
             old_value = value
+    return data
+
+
+def _interpolate_columns_numpy(columns, original_points, new_points):
+    np = get_numpy()
+    x = np.frombuffer(array.array("q", original_points), dtype=np.int64)
+    new_x = np.frombuffer(array.array("q", new_points), dtype=np.int64)
+    # Same as bisect_left(original_points, point) - 1 for every point at once
+    indices = np.searchsorted(x, new_x, side="left") - 1
+
+    results = []
+    for data in columns:
+        y = np.frombuffer(data, dtype=np.int64)
+        # Intervals are zipped, so only the common prefix of both lists has slopes
+        num_slopes = max(min(len(x), len(y)) - 1, 0)
+        result = np.where(indices < 0, y[0], y[-1])
+
+        if num_slopes > 0:
+            dx = x[1 : num_slopes + 1] - x[:num_slopes]
+            slopes = (y[1 : num_slopes + 1] - y[:num_slopes]) // np.where(
+                dx == 0, 1, dx
+            )
+            inside = (indices >= 0) & (indices < num_slopes)
+            i = indices[inside]
+            result[inside] = y[i] + slopes[i] * (new_x[inside] - x[i])
+
+        results.append(_to_array(result))
+    return results
+
+
+def _interpolate_columns_python(columns, original_points, new_points):
+    # The new points are sorted, so the interval of each of them is found by
+    # walking the original points once instead of bisecting for every point
+    indices = []
+    i = 0
+    for point in new_points:
+        while i < len(original_points) and original_points[i] < point:
+            i += 1
+        indices.append(i - 1)
+
+    results = []
+    for data in columns:
+        intervals = zip(original_points, original_points[1:], data, data[1:])
+        slopes = [(y2 - y1) // ((x2 - x1) or 1) for x1, x2, y1, y2 in intervals]
+
+        result = array.array("q")
+        for point, i in zip(new_points, indices):
+            if i >= len(slopes):
+                result.append(data[-1])
+            elif i < 0:
+                result.append(data[0])
+            else:
+                result.append(data[i] + slopes[i] * (point - original_points[i]))
+        results.append(result)
+    return results
+
+
+def interpolate_columns(columns, original_points, new_points):
+    """Interpolates every column sampled at original_points onto new_points,
+    sharing the interval lookup of the timeline between the columns."""
+    columns = [_fill_missing_values(array.array("q", data)) for data in columns]
 
     if len(new_points) == 0:
-        return array.array("q", [])
+        return [array.array("q", []) for _ in columns]
     if len(original_points) == 0:
-        return array.array("q", [0] * len(new_points))
+        return [array.array("q", [0] * len(new_points)) for _ in columns]
     if len(original_points) == 1:
-        return array.array("q", [original_points[0]] * len(new_points))
-    interpolate = Interpolate(original_points, data)
-    return array.array("q", (interpolate[point] for point in new_points))
-
-
-def track_points(track_data):
-    for time, lat, lon, alt, hr, stride, cadence in zip(
-        track_data.times,
-        track_data.lat,
-        track_data.lon,
-        track_data.alt,
-        track_data.hr,
-        track_data.stride,
-        track_data.cadence,
-    ):
-        yield TrackPoint(
-            time=time,
-            position=Position(lat=lat / 100000000, lon=lon / 100000000, alt=alt / 100),
-            hr=hr,
-            stride=stride,
-            cadence=cadence,
-        )
+        return [
+            array.array("q", [original_points[0]] * len(new_points)) for _ in columns
+        ]
+    if get_numpy() is not None:
+        return _interpolate_columns_numpy(columns, original_points, new_points)
+    return _interpolate_columns_python(columns, original_points, new_points)
+
+
+def interpolate_column(data, original_points, new_points):
+    return interpolate_columns([data], original_points, new_points)[0]
+
+
+def merge_times(*streams):
+    """Merges sorted time streams into one sorted timeline without duplicates."""
+    times = array.array("q")
+    for time in heapq.merge(*streams):
+        if not times or time > times[-1]:
+            times.append(time)
+        elif time < times[-1]:
+            # Only cumulated negative deltas leave a stream unsorted
+            return array.array("q", sorted(set(chain(*streams))))
+    return times
+
 
+def trim_gaps(times, time_to_trim):
+    """Shortens the longest intervals of the timeline by time_to_trim in total,
+    down to 1 second each, and returns the trimmed timeline.
 
-def interpolate_data(track_data):
+    Same result as repeatedly shortening the longest interval (the first one of
+    equal intervals), but every interval is only looked at once.
+    """
+    intervals = [
+        (previous - time, i)
+        for i, (previous, time) in enumerate(zip(chain([0], times), times))
+        if time - previous > 1
+    ]
+    heapq.heapify(intervals)
+
+    trimmed = array.array("q", bytes(8 * len(times)))
+    while time_to_trim > 0 and intervals:
+        negative_interval, i = heapq.heappop(intervals)
+        trimmed[i] = min(-negative_interval - 1, time_to_trim)
+        time_to_trim -= trimmed[i]
+    return array.array(
+        "q", (time - shift for time, shift in zip(times, accumulate(trimmed)))
+    )
+
+
+def interpolate_data(track_data, fix_gaps=None):
     track_times = array.array("q", accumulate(track_data.times))
     hr_times = array.array("q", accumulate(track_data.hrtimes))
     step_times = array.array("q", accumulate(track_data.steptimes))
 
-    def change_times(times, change, time_from):
-        return array.array(
-            "q", (time + change if time >= time_from else time for time in times)
-        )
+    times = merge_times(track_times, hr_times, step_times)
 
-    times = list(sorted(set(track_times).union(hr_times).union(step_times)))
-
-    if FIX_BIP_GAPS:
-        time_to_trim = (times[-1] - track_data.cost_time) if track_times else 0
-        while time_to_trim > 0:
-            max_time = 0
-            max_interval = 0
-            last_time = 0
-            for time in times:
-                current_interval = time - last_time
-                last_time = time
-                if current_interval > max_interval:
-                    max_interval = current_interval
-                    max_time = time
-            time_change = max(max_interval - time_to_trim, 1) - max_interval
-            track_times = change_times(track_times, time_change, max_time)
-            hr_times = change_times(hr_times, time_change, max_time)
-            step_times = change_times(step_times, time_change, max_time)
-            time_to_trim += time_change
-            times = list(sorted(set(track_times).union(hr_times).union(step_times)))
+    if fix_gaps is None:
+        fix_gaps = FIX_BIP_GAPS
+    # Without the run time of the summary there's nothing to trim the track to
+    if fix_gaps and track_times and track_data.cost_time > 0:
+        time_to_trim = times[-1] - track_data.cost_time
+        if time_to_trim > 0:
+            trimmed_times = trim_gaps(times, time_to_trim)
+            new_time = dict(zip(times, trimmed_times)).__getitem__
+            track_times = array.array("q", map(new_time, track_times))
+            hr_times = array.array("q", map(new_time, hr_times))
+            step_times = array.array("q", map(new_time, step_times))
+            times = trimmed_times
+
+    lat, lon, alt = interpolate_columns(
+        [accumulate(track_data.lat), accumulate(track_data.lon), track_data.alt],
+        track_times,
+        times,
+    )
+    (hr,) = interpolate_columns([accumulate(track_data.hr)], hr_times, times)
+    stride, cadence = interpolate_columns(
+        [track_data.stride, track_data.cadence], step_times, times
+    )
 
     return track_data._replace(
         times=times,
-        lat=interpolate_column(accumulate(track_data.lat), track_times, times),
-        lon=interpolate_column(accumulate(track_data.lon), track_times, times),
-        alt=interpolate_column(track_data.alt, track_times, times),
+        lat=lat,
+        lon=lon,
+        alt=alt,
         hrtimes=times,
-        hr=interpolate_column(accumulate(track_data.hr), hr_times, times),
+        hr=hr,
         steptimes=times,
-        stride=interpolate_column(track_data.stride, step_times, times),
-        cadence=interpolate_column(track_data.cadence, step_times, times),
+        stride=stride,
+        cadence=cadence,
     )
 
 
-def parse_points(
-    summary: WorkoutSummary, detail: WorkoutDetailData
-) -> List[ExportablePoint]:
+def _scale_column(data, divisor):
+    np = get_numpy()
+    if np is not None:
+        return _to_array(
+            np.frombuffer(array.array("q", data), dtype=np.int64) / divisor, "d"
+        )
+    return array.array("d", (value / divisor for value in data))
+
+
+def build_track(track_data) -> ExportableTrack:
+    np = get_numpy()
+    if np is not None:
+        time = _to_array(
+            np.asarray(track_data.times, dtype=np.int64) + track_data.start_time
+        )
+    else:
+        time = array.array("q", (t + track_data.start_time for t in track_data.times))
+
+    return ExportableTrack(
+        time=time,
+        latitude=_scale_column(track_data.lat, 100000000),
+        longitude=_scale_column(track_data.lon, 100000000),
+        altitude=_scale_column(track_data.alt, 100),
+        heart_rate=_scale_column(track_data.hr, 1),
+        cadence=_scale_column(track_data.cadence, 1),
+        stride=_scale_column(track_data.stride, 1),
+    )
+
+
+def parse_points(summary: WorkoutSummary, detail: WorkoutDetailData) -> ExportableTrack:
     track_data = parse_track_data(summary, detail)
 
     if not track_data.lat:
-        return []
+        return ExportableTrack.empty()
+
+    return build_track(interpolate_data(track_data))
 
-    points = [
-        ExportablePoint(
-            time=datetime.utcfromtimestamp(point.time + track_data.start_time),
-            latitude=point.position.lat,
-            longitude=point.position.lon,
-            altitude=point.position.alt,
-            heart_rate=point.hr,
-            cadence=point.cadence,
-        )
-        for point in track_points(interpolate_data(track_data))
-    ]
 
-    return points
+def parse_points_json(summary: WorkoutSummary, detail_json: bytes) -> ExportableTrack:
+    # The detail is validated here rather than on download, so only the raw bytes
+    # are sent to the parse processes and the validation runs there too
+    detail = WorkoutDetail.model_validate_json(detail_json)
+    return parse_points(summary, detail.data)
+
+
+class BaseDatasetWriter(abc.ABC):
+    """Collects the tracks of many workouts into a single output dataset."""
+
+    @abc.abstractmethod
+    def write(self, summary: WorkoutSummary, track: ExportableTrack):
+        raise NotImplementedError()
+
+    def close(self):
+        pass
 
 
 class BaseExporter(abc.ABC):
@@ -260,11 +499,26 @@ class BaseExporter(abc.ABC):
     def get_supported_file_formats(self) -> List[str]:
         raise NotImplementedError()
 
+    def get_dataset_file_formats(self) -> List[str]:
+        return []
+
     @abc.abstractmethod
     def export(
         self,
         output_file_path: Path,
         summary: WorkoutSummary,
-        points: List[ExportablePoint],
+        track: ExportableTrack,
     ):
         raise NotImplementedError()
+
+    def export_many(
+        self,
+        output_file_paths: List[Path],
+        summary: WorkoutSummary,
+        track: ExportableTrack,
+    ):
+        for output_file_path in output_file_paths:
+            self.export(output_file_path, summary, track)
+
+    def open_dataset(self, output_path: Path) -> BaseDatasetWriter:
+        raise NotImplementedError()
@@ -0,0 +1,234 @@
+import array
+import codecs
+import re
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from src import constants
+from src.api import WorkoutSummary
+from src.exporters.base_exporter import (
+    ExportableTrack,
+    RawTrackData,
+    build_track,
+    get_numpy,
+    interpolate_data,
+    parse_numpy_columns,
+)
+
+# Number of values per sample of the delimited detail fields, and the value of an
+# empty first column
+DETAIL_FIELDS: Dict[str, Tuple[int, Optional[int]]] = {
+    "time": (1, None),
+    "longitude_latitude": (2, None),
+    "altitude": (1, None),
+    "heart_rate": (2, 1),
+    "gait": (4, None),
+}
+
+_STRING_STOP = re.compile(r'["\\]')
+
+
+class _ColumnDecoder:
+    """Decodes a "a,b,...;a,b,...;" string fed in pieces into one typed array per
+    column, only the last unfinished sample is kept as text."""
+
+    def __init__(self, num_columns: int, empty_first: Optional[int] = None):
+        self.num_columns: int = num_columns
+        self.empty_first: Optional[int] = empty_first
+        self.columns: List[array.array] = [array.array("q") for _ in range(num_columns)]
+        self._tail: str = ""
+
+    def feed(self, text: str) -> None:
+        text = self._tail + text
+        end = text.rfind(";")
+        if end == -1:
+            self._tail = text
+            return
+        self._tail = text[end + 1 :]
+        self._decode(text[:end])
+
+    def close(self) -> None:
+        if self._tail:
+            self._decode(self._tail)
+            self._tail = ""
+
+    def _decode(self, text: str) -> None:
+        np = get_numpy()
+        if np is not None:
+            try:
+                values = parse_numpy_columns(
+                    text, self.num_columns, empty_first=self.empty_first
+                )
+            except ValueError:
+                pass
+            else:
+                for i, column in enumerate(self.columns):
+                    column.frombytes(
+                        np.ascontiguousarray(values[:, i], dtype=np.int64).tobytes()
+                    )
+                return
+
+        for sample in filter(None, text.split(";")):
+            values = sample.split(",")
+            if len(values) < self.num_columns:
+                raise ValueError(f"Sample {sample!r} has too few values")
+            if not values[0] and self.empty_first is not None:
+                values[0] = str(self.empty_first)
+            for column, value in zip(self.columns, values):
+                column.append(int(value))
+
+
+class DetailStreamParser:
+    """Incremental parser of the JSON of a workout detail, fed with the response
+    body as it's downloaded.
+
+    The delimited fields of the detail are decoded into typed arrays while they
+    arrive, neither the body nor the strings of these fields are ever held whole.
+    Every other value is skipped without being decoded, except the code of the
+    response. close raises for an error response or a detail without these fields,
+    like the validation of parse_points_json does.
+    """
+
+    def __init__(self):
+        self.decoders: Dict[str, _ColumnDecoder] = {
+            field: _ColumnDecoder(*spec) for field, spec in DETAIL_FIELDS.items()
+        }
+        self._text = codecs.getincrementaldecoder("utf-8")()
+        # "{" and "[" of the containers the parser is in
+        self._containers: List[str] = []
+        self._expect_key: bool = False
+        self._in_string: bool = False
+        self._escape: bool = False
+        self._key: Optional[str] = None
+        # Pieces of the key being read, or the decoder of the value being read
+        self._key_parts: Optional[List[str]] = None
+        self._decoder: Optional[_ColumnDecoder] = None
+        # Characters of the top level "code" number, whether the "data" object was
+        # entered and which of its decoded fields were read
+        self._code_parts: List[str] = []
+        self._data_seen: bool = False
+        self._fields_seen: Set[str] = set()
+
+    def feed(self, data: bytes) -> None:
+        self._feed_text(self._text.decode(data))
+
+    def close(self) -> None:
+        self._feed_text(self._text.decode(b"", final=True))
+        if self._in_string or self._containers:
+            raise ValueError("The workout detail is incomplete")
+
+        code = "".join(self._code_parts)
+        if code != str(constants.SUCCESS_CODE):
+            raise ValueError(f"The workout detail has the error code {code or None}")
+        if not self._data_seen:
+            raise ValueError("The workout detail has no data")
+        if missing := set(self.decoders) - self._fields_seen:
+            raise ValueError(
+                f"The workout detail misses the fields {', '.join(sorted(missing))}"
+            )
+
+    def _feed_text(self, text: str) -> None:
+        i = 0
+        while i < len(text):
+            if self._in_string:
+                i = self._read_string(text, i)
+                continue
+
+            char = text[i]
+            if char == '"':
+                self._start_string()
+            elif char in "{[":
+                if len(self._containers) == 1 and self._key == "data":
+                    self._data_seen = char == "{"
+                self._containers.append(char)
+                self._expect_key = char == "{"
+            elif char in "}]":
+                self._containers.pop()
+            elif char == ":":
+                self._expect_key = False
+            elif char == ",":
+                self._expect_key = self._containers[-1] == "{"
+            elif (
+                len(self._containers) == 1
+                and self._key == "code"
+                and not self._expect_key
+                and not char.isspace()
+            ):
+                self._code_parts.append(char)
+            i += 1
+
+    def _start_string(self) -> None:
+        self._in_string = True
+        if self._expect_key:
+            self._key_parts = []
+        elif len(self._containers) == 2 and self._containers[-1] == "{":
+            # The fields of the "data" object
+            self._decoder = self.decoders.get(self._key) if self._key else None
+            if self._decoder is not None and self._key:
+                self._fields_seen.add(self._key)
+
+    def _read_string(self, text: str, i: int) -> int:
+        if self._escape:
+            # The escaped character is dropped, none of the decoded fields has one
+            self._escape = False
+            return i + 1
+
+        match = _STRING_STOP.search(text, i)
+        end = match.start() if match else len(text)
+        if self._key_parts is not None:
+            self._key_parts.append(text[i:end])
+        elif self._decoder is not None:
+            self._decoder.feed(text[i:end])
+
+        if match is None:
+            return end
+        if text[end] == "\\":
+            self._escape = True
+            return end + 1
+
+        self._in_string = False
+        if self._key_parts is not None:
+            self._key = "".join(self._key_parts)
+            self._key_parts = None
+        if self._decoder is not None:
+            self._decoder.close()
+            self._decoder = None
+        return end + 1
+
+    def get_track_data(self, summary: WorkoutSummary) -> RawTrackData:
+        (times,) = self.decoders["time"].columns
+        lat, lon = self.decoders["longitude_latitude"].columns
+        (alt,) = self.decoders["altitude"].columns
+        hrtimes, hr = self.decoders["heart_rate"].columns
+        steptimes, _, stride, cadence = self.decoders["gait"].columns
+
+        return RawTrackData(
+            start_time=int(summary.trackid),
+            end_time=int(summary.end_time),
+            cost_time=int(float(summary.run_time or -1)),
+            distance=float(summary.dis),
+            times=times,
+            lat=lat,
+            lon=lon,
+            alt=alt,
+            hrtimes=hrtimes,
+            hr=hr,
+            steptimes=steptimes,
+            stride=stride,
+            cadence=cadence,
+        )
+
+
+def parse_points_stream(
+    summary: WorkoutSummary, chunks: Iterable[bytes]
+) -> ExportableTrack:
+    """Same as parse_points, for a detail whose JSON is still being downloaded."""
+    parser = DetailStreamParser()
+    for chunk in chunks:
+        parser.feed(chunk)
+    parser.close()
+
+    track_data = parser.get_track_data(summary)
+    if not track_data.lat:
+        return ExportableTrack.empty()
+
+    return build_track(interpolate_data(track_data))
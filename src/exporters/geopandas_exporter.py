@@ -1,17 +1,237 @@
 import logging
 import sqlite3
-from datetime import datetime
+import threading
+from itertools import repeat
 from pathlib import Path
 from typing import List
 
 import geopandas as gpd
-from shapely.geometry import Point
+import numpy as np
 
 from src.api import WorkoutSummary
-from src.exporters.base_exporter import BaseExporter, ExportablePoint
+from src.exporters.base_exporter import (
+    BaseDatasetWriter,
+    BaseExporter,
+    ExportableTrack,
+)
 
 LOGGER = logging.getLogger(__name__)
 
+DATETIME_COLUMNS = ["track_date", "timestamp"]
+# Formats storing the datetime columns with their time of day, the others get ISO
+# strings, e.g. shapefiles only have a date type
+DATETIME_FILE_EXTENSIONS = {".geojson", ".gpkg", ".parquet"}
+
+
+def _column(data, dtype):
+    # The track columns are typed arrays, so they are wrapped without copying
+    return np.frombuffer(data, dtype=dtype)
+
+
+def build_geodataframe(summary: WorkoutSummary, track: ExportableTrack):
+    track_date = np.datetime64(int(summary.trackid), "s")
+    latitude = _column(track.latitude, np.float64)
+    longitude = _column(track.longitude, np.float64)
+
+    # The coordinates are already in WGS 84, so the CRS is only assigned and the
+    # points are never reprojected
+    return gpd.GeoDataFrame(
+        {
+            "track_date": np.full(len(track), track_date),
+            "timestamp": _column(track.time, np.int64).view("datetime64[s]"),
+            "latitude": latitude,
+            "longitude": longitude,
+            "altitude": _column(track.altitude, np.float64),
+            "heart_rate": _column(track.heart_rate, np.float64),
+            "cadence": _column(track.cadence, np.float64),
+        },
+        geometry=gpd.points_from_xy(latitude, longitude),
+        crs="EPSG:4326",
+    )
+
+
+def _to_iso_strings(gdf):
+    gdf = gdf.copy(deep=False)
+    for column in DATETIME_COLUMNS:
+        gdf[column] = np.datetime_as_string(gdf[column].to_numpy(dtype="datetime64[s]"))
+    return gdf
+
+
+def write_geodataframe(gdf, output_file_path: Path):
+    ext = output_file_path.suffix
+    if ext not in DATETIME_FILE_EXTENSIONS:
+        gdf = _to_iso_strings(gdf)
+
+    if ext == ".geojson":
+        gdf.to_file(output_file_path, driver="GeoJSON")
+    elif ext == ".gpkg":
+        gdf.to_file(output_file_path, driver="GPKG")
+    elif ext == ".parquet":
+        gdf.to_parquet(output_file_path)
+    elif ext == ".shp":
+        gdf.to_file(output_file_path, driver="ESRI Shapefile")
+    elif ext == ".csv":
+        gdf.to_csv(output_file_path)
+    elif ext == ".json":
+        gdf.to_json(str(output_file_path))
+    elif ext == ".xslx":
+        gdf.to_excel(output_file_path)
+    elif ext in [".sql", ".sqlite3"]:
+        con = sqlite3.connect(":memory:" if ext == ".sql" else output_file_path)
+        gdf.drop(columns=["geometry"]).to_sql(
+            name="points", con=con, if_exists="append"
+        )
+
+        if ext == ".sql":
+            with open(output_file_path, "w") as f:
+                for line in con.iterdump():
+                    f.write(f"{line}\n")
+    elif ext == ".xml":
+        gdf.to_xml(output_file_path)
+    elif ext == ".html":
+        gdf.to_html(output_file_path)
+    else:
+        LOGGER.error(f"File format is not implemented: {ext}")
+
+
+class SqliteDatasetWriter(BaseDatasetWriter):
+    """Stores every workout in one SQLite database with a workouts and a points
+    table. For .sql the database is kept in memory and dumped on close."""
+
+    def __init__(self, output_path: Path):
+        self.output_path: Path = output_path
+        self.dump: bool = output_path.suffix == ".sql"
+        self._lock = threading.Lock()
+        self._con = sqlite3.connect(
+            ":memory:" if self.dump else output_path, check_same_thread=False
+        )
+
+        # Workouts exported by previous runs are kept, so incremental runs only
+        # add the new ones
+        if self.dump and output_path.exists():
+            self._con.executescript(output_path.read_text())
+
+        self._con.executescript(
+            "CREATE TABLE IF NOT EXISTS workouts ("
+            "trackid INTEGER PRIMARY KEY, "
+            "source TEXT, "
+            "type INTEGER, "
+            "version INTEGER, "
+            "track_date TEXT, "
+            "end_date TEXT, "
+            "distance REAL, "
+            "run_time REAL, "
+            "num_points INTEGER);"
+            "CREATE TABLE IF NOT EXISTS points ("
+            "trackid INTEGER NOT NULL REFERENCES workouts (trackid), "
+            "timestamp TEXT NOT NULL, "
+            "latitude REAL, "
+            "longitude REAL, "
+            "altitude REAL, "
+            "heart_rate REAL, "
+            "cadence REAL, "
+            "stride REAL);"
+            "CREATE INDEX IF NOT EXISTS points_trackid_timestamp "
+            "ON points (trackid, timestamp);"
+            "CREATE INDEX IF NOT EXISTS points_timestamp ON points (timestamp);"
+        )
+        self._con.commit()
+
+    def write(self, summary: WorkoutSummary, track: ExportableTrack):
+        trackid = int(summary.trackid)
+        timestamps = np.datetime_as_string(
+            _column(track.time, np.int64).view("datetime64[s]")
+        ).tolist()
+        workout = (
+            trackid,
+            summary.source,
+            summary.type,
+            summary.version,
+            str(np.datetime64(trackid, "s")),
+            str(np.datetime64(int(summary.end_time), "s")),
+            float(summary.dis),
+            float(summary.run_time),
+            len(track),
+        )
+        points = zip(
+            repeat(trackid),
+            timestamps,
+            track.latitude,
+            track.longitude,
+            track.altitude,
+            track.heart_rate,
+            track.cadence,
+            track.stride,
+        )
+
+        # One transaction per workout, replacing the points of a re-exported one
+        with self._lock, self._con:
+            self._con.execute("DELETE FROM points WHERE trackid = ?", (trackid,))
+            self._con.execute(
+                "INSERT OR REPLACE INTO workouts VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                workout,
+            )
+            self._con.executemany(
+                "INSERT INTO points VALUES (?, ?, ?, ?, ?, ?, ?, ?)", points
+            )
+
+    def close(self):
+        with self._lock:
+            if self.dump:
+                with open(self.output_path, "w") as f:
+                    for line in self._con.iterdump():
+                        f.write(f"{line}\n")
+            self._con.close()
+
+
+class GpkgDatasetWriter(BaseDatasetWriter):
+    """Appends every workout to a single points layer of a GeoPackage."""
+
+    LAYER = "points"
+
+    def __init__(self, output_path: Path):
+        self.output_path: Path = output_path
+        self._lock = threading.Lock()
+
+    def write(self, summary: WorkoutSummary, track: ExportableTrack):
+        trackid = int(summary.trackid)
+        gdf = build_geodataframe(summary, track)
+        gdf.insert(0, "trackid", trackid)
+
+        with self._lock:
+            if self.output_path.exists():
+                # A GeoPackage is a SQLite database, so the points of a re-exported
+                # workout are dropped in place before the new ones are appended
+                with sqlite3.connect(self.output_path) as con:
+                    con.execute(
+                        f"DELETE FROM {self.LAYER} WHERE trackid = ?", (trackid,)
+                    )
+                con.close()
+                gdf.to_file(self.output_path, layer=self.LAYER, driver="GPKG", mode="a")
+            else:
+                gdf.to_file(self.output_path, layer=self.LAYER, driver="GPKG")
+
+
+class ParquetDatasetWriter(BaseDatasetWriter):
+    """Writes a Parquet dataset partitioned by trackid (trackid=<id>/part-0.parquet),
+    which can be read back at once with geopandas.read_parquet."""
+
+    def __init__(self, output_path: Path):
+        self.output_path: Path = output_path
+
+    def write(self, summary: WorkoutSummary, track: ExportableTrack):
+        partition_path = self.output_path / f"trackid={int(summary.trackid)}"
+        partition_path.mkdir(parents=True, exist_ok=True)
+        build_geodataframe(summary, track).to_parquet(partition_path / "part-0.parquet")
+
+
+DATASET_WRITERS = {
+    ".gpkg": GpkgDatasetWriter,
+    ".parquet": ParquetDatasetWriter,
+    ".sql": SqliteDatasetWriter,
+    ".sqlite3": SqliteDatasetWriter,
+}
+
 
 class GeoPandasExporter(BaseExporter):
     def get_supported_file_formats(self) -> List[str]:
@@ -29,73 +249,28 @@ class GeoPandasExporter(BaseExporter):
             "html",
         ]
 
+    def get_dataset_file_formats(self) -> List[str]:
+        return [ext.lstrip(".") for ext in DATASET_WRITERS]
+
+    def open_dataset(self, output_path: Path) -> BaseDatasetWriter:
+        return DATASET_WRITERS[output_path.suffix](output_path)
+
     def export(
         self,
         output_file_path: Path,
         summary: WorkoutSummary,
-        points: List[ExportablePoint],
+        track: ExportableTrack,
     ):
-        track_date = datetime.utcfromtimestamp(int(summary.trackid)).isoformat()
-
-        data = [
-            {
-                "track_date": track_date,
-                "timestamp": point.time.isoformat(),
-                "latitude": point.latitude,
-                "longitude": point.longitude,
-                "altitude": point.altitude,
-                "heart_rate": point.heart_rate,
-                "cadence": point.cadence,
-                "geometry": Point(point.latitude, point.longitude),
-            }
-            for point in points
-        ]
+        self.export_many([output_file_path], summary, track)
 
-        gdf = gpd.GeoDataFrame(data, geometry="geometry")
-        gdf = gdf[
-            [
-                "track_date",
-                "timestamp",
-                "latitude",
-                "longitude",
-                "altitude",
-                "heart_rate",
-                "cadence",
-                "geometry",
-            ]
-        ]
-        gdf.geometry = gdf.geometry.set_crs(epsg=4326)
-        gdf.geometry = gdf.geometry.to_crs(epsg=4326)
-
-        ext = output_file_path.suffix
-
-        if ext == ".geojson":
-            gdf.to_file(output_file_path, driver="GeoJSON")
-        elif ext == ".gpkg":
-            gdf.to_file(output_file_path, driver="GPKG")
-        elif ext == ".parquet":
-            gdf.to_parquet(output_file_path)
-        elif ext == ".shp":
-            gdf.to_file(output_file_path, driver="ESRI Shapefile")
-        elif ext == ".csv":
-            gdf.to_csv(output_file_path)
-        elif ext == ".json":
-            gdf.to_json(str(output_file_path))
-        elif ext == ".xslx":
-            gdf.to_excel(output_file_path)
-        elif ext in [".sql", ".sqlite3"]:
-            con = sqlite3.connect(":memory:" if ext == ".sql" else output_file_path)
-            gdf.drop(columns=["geometry"]).to_sql(
-                name="points", con=con, if_exists="append"
-            )
+    def export_many(
+        self,
+        output_file_paths: List[Path],
+        summary: WorkoutSummary,
+        track: ExportableTrack,
+    ):
+        # Every driver writes the same GeoDataFrame, so it's only built once
+        gdf = build_geodataframe(summary, track)
 
-            if ext == ".sql":
-                with open(output_file_path, "w") as f:
-                    for line in con.iterdump():
-                        f.write(f"{line}\n")
-        elif ext == ".xml":
-            gdf.to_xml(output_file_path)
-        elif ext == ".html":
-            gdf.to_html(output_file_path)
-        else:
-            LOGGER.error(f"File format is not implemented: {ext}")
+        for output_file_path in output_file_paths:
+            write_geodataframe(gdf, output_file_path)
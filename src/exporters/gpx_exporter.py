@@ -1,24 +1,20 @@
 # Based on https://github.com/mireq/MiFitDataExport
+import gzip
 import logging
 from datetime import datetime
 from pathlib import Path
-from typing import List, Optional
+from typing import Dict, Iterator, List, Optional, TextIO
+from xml.sax.saxutils import escape
 
 from src.api import WorkoutSummary
-from src.exporters.base_exporter import BaseExporter, ExportablePoint
+from src.constants import WORKOUT_TYPE_MAP
+from src.exporters.base_exporter import BaseExporter, ExportableTrack
 
 LOGGER = logging.getLogger(__name__)
 
-WORKOUT_TYPE_MAP = {
-    1: "running",
-    6: "walking",
-    8: "treadmill_running",
-    9: "cycling",
-    10: "indoor_cycling",
-    16: "other",
-    23: "indoor_rowing",
-    92: "badminton",
-}
+IND = "\t"
+BATCH_SIZE = 4096
+BUFFER_SIZE = 1 << 20
 
 
 def _map_workout_type(summary: WorkoutSummary) -> Optional[str]:
@@ -28,54 +24,120 @@ def _map_workout_type(summary: WorkoutSummary) -> Optional[str]:
     return workout_type
 
 
+class _TimeFormatter:
+    """Formats UTC epoch seconds like datetime.isoformat(), the date part is only
+    computed once per day since the points are ordered by time."""
+
+    def __init__(self):
+        self._day: Optional[int] = None
+        self._prefix: str = ""
+
+    def __call__(self, time: int) -> str:
+        day, seconds = divmod(time, 86400)
+        if day != self._day:
+            self._day = day
+            self._prefix = datetime.utcfromtimestamp(day * 86400).strftime("%Y-%m-%dT")
+        hours, seconds = divmod(seconds, 3600)
+        minutes, seconds = divmod(seconds, 60)
+        return f"{self._prefix}{hours:02}:{minutes:02}:{seconds:02}"
+
+
+def _format_heart_rate(heart_rate: float) -> str:
+    return (
+        f"<gpxtpx:TrackPointExtension>"
+        f"<gpxtpx:hr>{int(heart_rate)}</gpxtpx:hr>"
+        f"</gpxtpx:TrackPointExtension>"
+        f"<gpxdata:hr>{int(heart_rate)}</gpxdata:hr>"
+    )
+
+
+def _format_cadence(cadence: float) -> str:
+    return f"<gpxdata:cadence>{cadence}</gpxdata:cadence>"
+
+
+def _format_extension(cache: Dict[float, str], value: float, format_value) -> str:
+    # Heart rate and cadence only take a few distinct values per workout
+    if not value:
+        return ""
+    if (text := cache.get(value)) is None:
+        text = cache[value] = format_value(value)
+    return text
+
+
+def format_track_points(
+    track: ExportableTrack, batch_size: int = BATCH_SIZE
+) -> Iterator[str]:
+    """Yields the <trkpt> elements of the track joined into chunks of batch_size
+    points."""
+    format_time = _TimeFormatter()
+    hr_cache: Dict[float, str] = {}
+    cadence_cache: Dict[float, str] = {}
+
+    batch: List[str] = []
+    for time, latitude, longitude, altitude, heart_rate, cadence in zip(
+        track.time,
+        track.latitude,
+        track.longitude,
+        track.altitude,
+        track.heart_rate,
+        track.cadence,
+    ):
+        batch.append(
+            f'{IND}{IND}{IND}<trkpt lat="{latitude}" lon="{longitude}">'
+            f"<ele>{altitude}</ele>"
+            f"<time>{format_time(time)}</time>"
+            f"<extensions>"
+            f"{_format_extension(hr_cache, heart_rate, _format_heart_rate)}"
+            f"{_format_extension(cadence_cache, cadence, _format_cadence)}"
+            f"</extensions>"
+            f"</trkpt>\n"
+        )
+        if len(batch) >= batch_size:
+            yield "".join(batch)
+            batch.clear()
+
+    if batch:
+        yield "".join(batch)
+
+
+def write_gpx(fp: TextIO, summary: WorkoutSummary, track: ExportableTrack):
+    time = escape(datetime.utcfromtimestamp(int(summary.trackid)).isoformat())
+    fp.write('<?xml version="1.0" encoding="UTF-8" standalone="no" ?>\n')
+    fp.write(
+        '<gpx xmlns="http://www.topografix.com/GPX/1/1" '
+        'xmlns:gpxdata="http://www.cluetrust.com/XML/GPXDATA/1/0" '
+        'xmlns:gpxtpx="http://www.garmin.com/xmlschemas/TrackPointExtension/v1">\n'
+    )
+    fp.write(f"{IND}<metadata><time>{time}</time></metadata>\n")
+    fp.write(f"{IND}<trk>\n")
+    fp.write(f"{IND}{IND}<name>{time}</name>\n")
+
+    if workout_type := _map_workout_type(summary):
+        fp.write(f"{IND}{IND}<type>{escape(workout_type)}</type>\n")
+
+    fp.write(f"{IND}{IND}<trkseg>\n")
+    for chunk in format_track_points(track):
+        fp.write(chunk)
+    fp.write(f"{IND}{IND}</trkseg>\n")
+    fp.write(f"{IND}</trk>\n")
+    fp.write("</gpx>")
+
+
 class GpxExporter(BaseExporter):
     def get_supported_file_formats(self) -> List[str]:
-        return ["gpx"]
+        return ["gpx", "gpx.gz"]
 
     def export(
         self,
         output_file_path: Path,
         summary: WorkoutSummary,
-        points: List[ExportablePoint],
+        track: ExportableTrack,
     ):
-        ind = "\t"
-        with output_file_path.open(mode="w") as fp:
-            time = datetime.utcfromtimestamp(int(summary.trackid)).isoformat()
-            fp.write('<?xml version="1.0" encoding="UTF-8" standalone="no" ?>\n')
-            fp.write(
-                '<gpx xmlns="http://www.topografix.com/GPX/1/1" '
-                'xmlns:gpxdata="http://www.cluetrust.com/XML/GPXDATA/1/0" '
-                'xmlns:gpxtpx="http://www.garmin.com/xmlschemas/TrackPointExtension/v1">\n'
-            )
-            fp.write(f"{ind}<metadata><time>{time}</time></metadata>\n")
-            fp.write(f"{ind}<trk>\n")
-            fp.write(f"{ind}{ind}<name>{time}</name>\n")
-
-            if workout_type := _map_workout_type(summary):
-                fp.write(f"{ind}{ind}<type>{workout_type}</type>\n")
-
-            fp.write(f"{ind}{ind}<trkseg>\n")
-            for point in points:
-                ext_hr = ""
-                ext_cadence = ""
-                if point.heart_rate:
-                    ext_hr = (
-                        f"<gpxtpx:TrackPointExtension>"
-                        f"<gpxtpx:hr>{int(point.heart_rate)}</gpxtpx:hr>"
-                        f"</gpxtpx:TrackPointExtension>"
-                        f"<gpxdata:hr>{int(point.heart_rate)}</gpxdata:hr>"
-                    )
-                if point.cadence:
-                    ext_cadence = f"<gpxdata:cadence>{point.cadence}</gpxdata:cadence>"
-                fp.write(
-                    f'{ind}{ind}{ind}<trkpt lat="{point.latitude}" lon="{point.longitude}">'
-                    f"<ele>{point.altitude}</ele>"
-                    f"<time>{point.time.isoformat()}</time>"
-                    f"<extensions>"
-                    f"{ext_hr}{ext_cadence}"
-                    f"</extensions>"
-                    f"</trkpt>\n"
-                )
-            fp.write(f"{ind}{ind}</trkseg>\n")
-            fp.write(f"{ind}</trk>\n")
-            fp.write("</gpx>")
+        if output_file_path.suffix == ".gz":
+            with gzip.open(output_file_path, mode="wt", encoding="utf-8") as fp:
+                write_gpx(fp, summary, track)
+        else:
+            with output_file_path.open(
+                mode="w", encoding="utf-8", buffering=BUFFER_SIZE
+            ) as fp:
+                write_gpx(fp, summary, track)
@@ -0,0 +1,78 @@
+import importlib
+import logging
+from importlib.metadata import entry_points
+from typing import Dict, List
+
+from src.exporters.base_exporter import BaseExporter
+
+LOGGER = logging.getLogger(__name__)
+
+ENTRY_POINT_GROUP = "mifit_exporter.exporters"
+
+# The file formats are listed here, so choosing a format doesn't import the
+# dependencies of every exporter
+BUILTIN_EXPORTERS: Dict[str, List[str]] = {
+    "src.exporters.gpx_exporter:GpxExporter": ["gpx", "gpx.gz"],
+    "src.exporters.geopandas_exporter:GeoPandasExporter": [
+        "geojson",
+        "gpkg",
+        "parquet",
+        "shp",
+        "csv",
+        "json",
+        "xlsx",
+        "sql",
+        "sqlite3",
+        "xml",
+        "html",
+    ],
+}
+
+
+class ExporterRegistry:
+    """Maps file formats to exporters, which are only imported and created when one
+    of their formats is requested.
+
+    Besides the built-in ones, exporters can be registered by other packages with
+    an entry point in the mifit_exporter.exporters group, named after the file
+    format and pointing to the exporter class:
+
+    [project.entry-points."mifit_exporter.exporters"]
+    fit = "my_package.fit_exporter:FitExporter"
+    """
+
+    def __init__(self, load_plugins: bool = True):
+        self._targets: Dict[str, str] = {}
+        self._instances: Dict[str, BaseExporter] = {}
+
+        for target, file_formats in BUILTIN_EXPORTERS.items():
+            self.register(target, file_formats)
+
+        if load_plugins:
+            self.load_entry_points()
+
+    def register(self, target: str, file_formats: List[str]) -> None:
+        for file_format in file_formats:
+            self._targets[file_format] = target
+
+    def load_entry_points(self, group: str = ENTRY_POINT_GROUP) -> None:
+        for entry_point in entry_points(group=group):
+            LOGGER.debug(f"Found exporter plugin {entry_point.value}")
+            self.register(entry_point.value, [entry_point.name])
+
+    def get_supported_file_formats(self) -> List[str]:
+        return list(self._targets)
+
+    def get_exporter(self, file_format: str) -> BaseExporter:
+        target = self._targets[file_format]
+
+        # Formats of the same exporter share one instance
+        if (exporter := self._instances.get(target)) is None:
+            module_name, _, class_name = target.partition(":")
+            exporter_class = getattr(importlib.import_module(module_name), class_name)
+            exporter = self._instances[target] = exporter_class()
+
+        assert file_format in exporter.get_supported_file_formats(), (
+            f"{target} doesn't support {file_format}"
+        )
+        return exporter
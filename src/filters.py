@@ -0,0 +1,64 @@
+from datetime import datetime
+from typing import Collection, List, Optional, Tuple
+
+from src import constants
+from src.api import WorkoutSummary
+
+INDOOR_WORKOUT_TYPES = frozenset(
+    workout_type
+    for workout_type, name in constants.WORKOUT_TYPE_MAP.items()
+    if name in constants.INDOOR_WORKOUT_TYPE_NAMES
+)
+
+
+class SummaryFilter:
+    """Selects the workouts to export by their summaries, so the details of the
+    other ones are never downloaded.
+
+    The history is served newest first, so paging stops at the first workout which
+    started before since, or once limit workouts have been selected.
+    """
+
+    def __init__(
+        self,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        types: Optional[Collection[int]] = None,
+        outdoor_only: bool = False,
+        min_distance: float = 0.0,
+        limit: Optional[int] = None,
+    ):
+        self.since: Optional[int] = int(since.timestamp()) if since else None
+        self.until: Optional[int] = int(until.timestamp()) if until else None
+        self.types: Optional[frozenset] = frozenset(types) if types else None
+        self.outdoor_only: bool = outdoor_only
+        self.min_distance: float = min_distance
+        self.limit: Optional[int] = limit
+
+    def matches(self, summary: WorkoutSummary) -> bool:
+        start_time = int(summary.trackid)
+        return (
+            (self.since is None or start_time >= self.since)
+            and (self.until is None or start_time < self.until)
+            and (self.types is None or summary.type in self.types)
+            and not (self.outdoor_only and summary.type in INDOOR_WORKOUT_TYPES)
+            and float(summary.dis or 0) >= self.min_distance
+        )
+
+    def select(
+        self, summaries: List[WorkoutSummary], selected: int = 0
+    ) -> Tuple[List[WorkoutSummary], bool]:
+        """Returns the matching summaries of a history page, given the number of
+        workouts selected from the previous pages, and whether paging is done."""
+        matching = []
+        for summary in summaries:
+            if self._is_limit_reached(selected + len(matching)):
+                return matching, True
+            if self.since is not None and int(summary.trackid) < self.since:
+                return matching, True
+            if self.matches(summary):
+                matching.append(summary)
+        return matching, self._is_limit_reached(selected + len(matching))
+
+    def _is_limit_reached(self, selected: int) -> bool:
+        return self.limit is not None and selected >= self.limit
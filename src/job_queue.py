@@ -0,0 +1,244 @@
+import logging
+import sqlite3
+import threading
+import time
+import zlib
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from src.api import WorkoutSummary
+
+LOGGER = logging.getLogger(__name__)
+
+PENDING = "pending"
+FETCHED = "fetched"
+EXPORTED = "exported"
+FAILED = "failed"
+
+
+# Jobs which aren't finished nor handed out to a worker, the states are literals
+# so SQLite can match the condition against the partial index
+UNCLAIMED_JOBS = f"claimed = 0 AND state IN ('{PENDING}', '{FETCHED}')"
+
+
+class Job(NamedTuple):
+    account: str
+    summary: WorkoutSummary
+    state: str
+
+
+class JobQueue:
+    """Persistent per-workout job state of a batch run, kept in a SQLite file.
+
+    Every workout of every account moves from pending to fetched (its detail is
+    stored, so it's never downloaded twice) and then to exported or failed. The
+    paging position of each account's history is stored as well, so an interrupted
+    run resumes where it stopped.
+    """
+
+    def __init__(self, path: Path, max_attempts: int = 3):
+        self.max_attempts: int = max_attempts
+        self._lock = threading.Lock()
+        self._con = sqlite3.connect(path, check_same_thread=False)
+        self._con.executescript(
+            "CREATE TABLE IF NOT EXISTS accounts ("
+            "name TEXT PRIMARY KEY, "
+            "history_done INTEGER NOT NULL DEFAULT 0, "
+            "next_track_id INTEGER, "
+            "scheduled_at REAL NOT NULL DEFAULT 0);"
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "account TEXT NOT NULL, "
+            "trackid TEXT NOT NULL, "
+            "source TEXT NOT NULL, "
+            "version INTEGER NOT NULL, "
+            "summary TEXT NOT NULL, "
+            "state TEXT NOT NULL, "
+            "attempts INTEGER NOT NULL DEFAULT 0, "
+            "detail BLOB, "
+            "error TEXT, "
+            "updated_at REAL NOT NULL, "
+            "PRIMARY KEY (account, trackid, source));"
+            "CREATE INDEX IF NOT EXISTS jobs_account_state "
+            "ON jobs (account, state, trackid);"
+        )
+        # Added after the first version of the file
+        columns = [row[1] for row in self._con.execute("PRAGMA table_info(jobs)")]
+        if "claimed" not in columns:
+            self._con.execute(
+                "ALTER TABLE jobs ADD COLUMN claimed INTEGER NOT NULL DEFAULT 0"
+            )
+        # Only covers the jobs left to claim, so finding the next one doesn't
+        # depend on the size of the queue
+        self._con.execute(
+            "CREATE INDEX IF NOT EXISTS jobs_unclaimed ON jobs (account, trackid) "
+            f"WHERE {UNCLAIMED_JOBS}"
+        )
+        self._con.commit()
+
+    def add_account(self, name: str) -> None:
+        with self._lock, self._con:
+            self._con.execute(
+                "INSERT OR IGNORE INTO accounts (name) VALUES (?)", (name,)
+            )
+
+    def start_run(self) -> None:
+        """Starts paging the histories again once the previous run has finished, and
+        requeues the failed jobs which still have attempts left."""
+        with self._lock, self._con:
+            # The jobs claimed by a killed run are picked up again
+            self._con.execute("UPDATE jobs SET claimed = 0 WHERE claimed = 1")
+            (unfinished,) = self._con.execute(
+                "SELECT COUNT(*) FROM accounts WHERE history_done = 0"
+            ).fetchone()
+            (unfinished_jobs,) = self._con.execute(
+                "SELECT COUNT(*) FROM jobs WHERE state IN (?, ?)", (PENDING, FETCHED)
+            ).fetchone()
+
+            if unfinished or unfinished_jobs:
+                LOGGER.info(
+                    f"Resuming the previous run with {unfinished_jobs} unfinished "
+                    f"jobs and {unfinished} histories to page"
+                )
+            else:
+                self._con.execute(
+                    "UPDATE accounts SET history_done = 0, next_track_id = NULL"
+                )
+
+            self._con.execute(
+                "UPDATE jobs SET state = ? WHERE state = ? AND attempts < ?",
+                (PENDING, FAILED, self.max_attempts),
+            )
+
+    def get_history_position(self, account: str) -> Tuple[bool, Optional[int]]:
+        with self._lock:
+            history_done, next_track_id = self._con.execute(
+                "SELECT history_done, next_track_id FROM accounts WHERE name = ?",
+                (account,),
+            ).fetchone()
+        return bool(history_done), next_track_id
+
+    def add_page(
+        self, account: str, summaries: List[WorkoutSummary], next_track_id: int
+    ) -> int:
+        """Queues the workouts of a history page and stores the paging position in
+        the same transaction. Returns the number of new or changed workouts."""
+        now = time.time()
+        added = 0
+        with self._lock, self._con:
+            for summary in summaries:
+                row = self._con.execute(
+                    "SELECT version FROM jobs "
+                    "WHERE account = ? AND trackid = ? AND source = ?",
+                    (account, summary.trackid, summary.source),
+                ).fetchone()
+                if row is not None and row[0] == summary.version:
+                    continue
+
+                added += 1
+                self._con.execute(
+                    "INSERT OR REPLACE INTO jobs "
+                    "(account, trackid, source, version, summary, state, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        account,
+                        summary.trackid,
+                        summary.source,
+                        summary.version,
+                        summary.model_dump_json(),
+                        PENDING,
+                        now,
+                    ),
+                )
+
+            self._con.execute(
+                "UPDATE accounts SET next_track_id = ?, history_done = ? "
+                "WHERE name = ?",
+                (next_track_id, int(next_track_id == -1), account),
+            )
+        return added
+
+    def claim(self) -> Optional[Job]:
+        """Hands out the next unfinished job. Accounts take turns, the one served
+        least recently goes first, so a big account doesn't starve the others."""
+        with self._lock:
+            accounts = [
+                name
+                for (name,) in self._con.execute(
+                    "SELECT name FROM accounts ORDER BY scheduled_at"
+                )
+            ]
+            for account in accounts:
+                row = self._con.execute(
+                    "SELECT trackid, source, summary, state FROM jobs "
+                    f"WHERE account = ? AND {UNCLAIMED_JOBS} "
+                    "ORDER BY trackid DESC LIMIT 1",
+                    (account,),
+                ).fetchone()
+                if row is None:
+                    continue
+
+                trackid, source, summary, state = row
+                now = time.time()
+                with self._con:
+                    self._con.execute(
+                        "UPDATE jobs SET claimed = 1, updated_at = ? "
+                        "WHERE account = ? AND trackid = ? AND source = ?",
+                        (now, account, trackid, source),
+                    )
+                    self._con.execute(
+                        "UPDATE accounts SET scheduled_at = ? WHERE name = ?",
+                        (now, account),
+                    )
+                return Job(account, WorkoutSummary.model_validate_json(summary), state)
+        return None
+
+    def get_detail(self, job: Job) -> Optional[bytes]:
+        with self._lock:
+            row = self._con.execute(
+                "SELECT detail FROM jobs "
+                "WHERE account = ? AND trackid = ? AND source = ?",
+                (job.account, job.summary.trackid, job.summary.source),
+            ).fetchone()
+        if row is None or row[0] is None:
+            return None
+        return zlib.decompress(row[0])
+
+    def mark_fetched(self, job: Job, detail: bytes) -> None:
+        self._update(job, FETCHED, detail=zlib.compress(detail))
+
+    def mark_exported(self, job: Job) -> None:
+        self._update(job, EXPORTED, detail=None, claimed=0)
+
+    def mark_failed(self, job: Job, error: str) -> None:
+        self._update(job, FAILED, error=error, attempt=True, claimed=0)
+
+    def _update(
+        self,
+        job: Job,
+        state: str,
+        attempt: bool = False,
+        **columns,
+    ) -> None:
+        assignments = "".join(f", {column} = ?" for column in columns)
+        key = (job.account, job.summary.trackid, job.summary.source)
+
+        with self._lock, self._con:
+            self._con.execute(
+                f"UPDATE jobs SET state = ?, updated_at = ?, "
+                f"attempts = attempts + ?{assignments} "
+                f"WHERE account = ? AND trackid = ? AND source = ?",
+                (state, time.time(), int(attempt), *columns.values(), *key),
+            )
+
+    def get_stats(self) -> Dict[str, Dict[str, int]]:
+        stats: Dict[str, Dict[str, int]] = {}
+        with self._lock:
+            for account, state, count in self._con.execute(
+                "SELECT account, state, COUNT(*) FROM jobs GROUP BY account, state"
+            ):
+                stats.setdefault(account, {})[state] = count
+        return stats
+
+    def close(self) -> None:
+        with self._lock:
+            self._con.close()
@@ -0,0 +1,164 @@
+import bisect
+import json
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+PROMETHEUS_PREFIX = "mifit_exporter"
+
+# Upper bounds in seconds, from a cached request up to a huge GeoPackage write
+LATENCY_BUCKETS: Tuple[float, ...] = (
+    0.001,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+)
+
+
+class Histogram:
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets: Tuple[float, ...] = buckets
+        # The last count is for the values above every bucket
+        self.counts: List[int] = [0] * (len(buckets) + 1)
+        self.count: int = 0
+        self.sum: float = 0.0
+        self.max: float = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "mean": self.sum / self.count if self.count else 0.0,
+            "max": self.max,
+            "buckets": {
+                str(bucket): count for bucket, count in zip(self.buckets, self.counts)
+            }
+            | {"+Inf": self.counts[-1]},
+        }
+
+
+class Metrics:
+    """Thread-safe counters and latency histograms of a run.
+
+    Counters are plain totals (requests, bytes_downloaded, points_parsed, ...),
+    timers record the duration of every call of a stage in a histogram.
+    """
+
+    def __init__(self):
+        self.counters: Dict[str, float] = {}
+        self.timers: Dict[str, Histogram] = {}
+        self._started_at: float = time.monotonic()
+        self._lock = threading.Lock()
+
+    def increment(self, name: str, value: float = 1) -> None:
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name: str, seconds: float) -> None:
+        with self._lock:
+            if (histogram := self.timers.get(name)) is None:
+                histogram = self.timers[name] = Histogram()
+            histogram.observe(seconds)
+
+    @contextmanager
+    def time(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def get_report(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "duration": time.monotonic() - self._started_at,
+                "counters": dict(sorted(self.counters.items())),
+                "timers": {
+                    name: histogram.to_dict()
+                    for name, histogram in sorted(self.timers.items())
+                },
+            }
+
+    def write_report(self, path: Path) -> None:
+        path.write_text(json.dumps(self.get_report(), indent=1))
+
+    def to_prometheus(self) -> str:
+        lines: List[str] = []
+        with self._lock:
+            for name, value in sorted(self.counters.items()):
+                metric = f"{PROMETHEUS_PREFIX}_{name}_total"
+                lines.append(f"# TYPE {metric} counter")
+                lines.append(f"{metric} {value}")
+
+            for name, histogram in sorted(self.timers.items()):
+                metric = f"{PROMETHEUS_PREFIX}_{name}_seconds"
+                lines.append(f"# TYPE {metric} histogram")
+                cumulative = 0
+                for bucket, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    lines.append(f'{metric}_bucket{{le="{bucket}"}} {cumulative}')
+                lines.append(f'{metric}_bucket{{le="+Inf"}} {histogram.count}')
+                lines.append(f"{metric}_sum {histogram.sum}")
+                lines.append(f"{metric}_count {histogram.count}")
+
+            lines.append(f"# TYPE {PROMETHEUS_PREFIX}_duration_seconds gauge")
+            lines.append(
+                f"{PROMETHEUS_PREFIX}_duration_seconds "
+                f"{time.monotonic() - self._started_at}"
+            )
+        return "\n".join(lines) + "\n"
+
+
+class MetricsServer:
+    """Serves the metrics in the Prometheus text format on /metrics while running."""
+
+    def __init__(self, metrics: Metrics, port: int, host: str = "127.0.0.1"):
+        self.metrics: Metrics = metrics
+        self.address: Tuple[str, int] = (host, port)
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    def start(self) -> None:
+        metrics = self.metrics
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+
+                body = metrics.to_prometheus().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(self.address, Handler)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def stop(self) -> None:
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
@@ -0,0 +1,71 @@
+import queue
+import threading
+from typing import Any, Callable, Iterable, List, NamedTuple
+
+_DONE = object()
+
+
+class Stage(NamedTuple):
+    """A step of the pipeline, func(key, value) is called by each of the workers
+    and returns the value passed to the next stage, or None to drop the item."""
+
+    name: str
+    func: Callable[[Any, Any], Any]
+    workers: int
+
+
+def run_pipeline(
+    keys: Iterable[Any],
+    stages: List[Stage],
+    queue_size: int,
+    on_error: Callable[[Stage, Any], None],
+) -> None:
+    """Runs every key through the stages, each stage having its own worker threads.
+
+    The stages are connected with queues holding at most queue_size items, so a
+    slow stage blocks the previous ones instead of letting items pile up. The first
+    stage is called with None as the value. on_error is called from the except
+    block when a stage raises, the item is dropped afterwards.
+    """
+    queues: List[queue.Queue] = [
+        queue.Queue(maxsize=max(queue_size, 1)) for _ in stages
+    ]
+
+    def work(index: int, stage: Stage):
+        in_queue = queues[index]
+        out_queue = queues[index + 1] if index + 1 < len(queues) else None
+
+        while (item := in_queue.get()) is not _DONE:
+            key, value = item
+            try:
+                value = stage.func(key, value)
+            except Exception:
+                on_error(stage, key)
+                continue
+
+            if value is not None and out_queue is not None:
+                out_queue.put((key, value))
+
+    threads = [
+        [
+            threading.Thread(
+                target=work, args=(index, stage), name=f"{stage.name}-{i}", daemon=True
+            )
+            for i in range(max(stage.workers, 1))
+        ]
+        for index, stage in enumerate(stages)
+    ]
+    for stage_threads in threads:
+        for thread in stage_threads:
+            thread.start()
+
+    try:
+        for key in keys:
+            queues[0].put((key, None))
+    finally:
+        # Stages are shut down in order, so every item reaches the last one
+        for in_queue, stage_threads in zip(queues, threads):
+            for _ in stage_threads:
+                in_queue.put(_DONE)
+            for thread in stage_threads:
+                thread.join()
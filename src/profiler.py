@@ -0,0 +1,93 @@
+import cProfile
+import heapq
+import json
+import logging
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Tuple
+
+from src.api import WorkoutSummary
+
+LOGGER = logging.getLogger(__name__)
+
+
+class ProfiledWorkout:
+    def __init__(self, trackid: str):
+        self.trackid: str = trackid
+        self.profile: cProfile.Profile = cProfile.Profile()
+        self.seconds: float = 0.0
+        self.points: int = 0
+        self.failed: bool = False
+
+    def __lt__(self, other: "ProfiledWorkout") -> bool:
+        return self.seconds < other.seconds
+
+
+class WorkoutProfiler:
+    """Profiles the parsing and the export of every workout with cProfile and keeps
+    the stats of the top slowest ones, which are dumped to output_dir."""
+
+    INDEX_FILE_NAME = "profiles.json"
+
+    def __init__(self, output_dir: Path, top: int = 10):
+        self.output_dir: Path = output_dir
+        self.top: int = max(top, 1)
+        self._running: Dict[str, ProfiledWorkout] = {}
+        # Min-heap of the finished workouts, so the fastest one is dropped first
+        self._slowest: List[ProfiledWorkout] = []
+
+    @contextmanager
+    def profile(self, summary: WorkoutSummary) -> Iterator[None]:
+        if (workout := self._running.get(summary.trackid)) is None:
+            workout = self._running[summary.trackid] = ProfiledWorkout(summary.trackid)
+
+        start = time.perf_counter()
+        workout.profile.enable()
+        try:
+            yield
+        finally:
+            workout.profile.disable()
+            workout.seconds += time.perf_counter() - start
+
+    def finish(
+        self, summary: WorkoutSummary, points: int, failed: bool = False
+    ) -> None:
+        if (workout := self._running.pop(summary.trackid, None)) is None:
+            return
+
+        workout.points = points
+        workout.failed = failed
+        if len(self._slowest) < self.top:
+            heapq.heappush(self._slowest, workout)
+        else:
+            heapq.heappushpop(self._slowest, workout)
+
+    def dump(self) -> List[Tuple[str, int, float, Path]]:
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+
+        results = []
+        index = []
+        for workout in sorted(self._slowest, reverse=True):
+            stats_path = self.output_dir / f"Workout-{workout.trackid}.prof"
+            workout.profile.dump_stats(stats_path)
+            results.append(
+                (workout.trackid, workout.points, workout.seconds, stats_path)
+            )
+            index.append(
+                {
+                    "trackid": workout.trackid,
+                    "points": workout.points,
+                    "seconds": workout.seconds,
+                    "failed": workout.failed,
+                    "stats_file": stats_path.name,
+                }
+            )
+            LOGGER.info(
+                f"Workout {workout.trackid}{' (failed)' if workout.failed else ''}: "
+                f"{workout.points} points in {workout.seconds:.3f}s, stats saved to "
+                f"{stats_path}"
+            )
+
+        (self.output_dir / self.INDEX_FILE_NAME).write_text(json.dumps(index, indent=1))
+        return results
@@ -0,0 +1,32 @@
+import threading
+import time
+
+
+class TokenBucket:
+    """Thread-safe token bucket allowing `rate` acquisitions per second on average,
+    with bursts of up to `capacity` acquisitions."""
+
+    def __init__(self, rate: float, capacity: float = 1.0):
+        assert rate > 0, "Rate must be positive"
+        self.rate: float = rate
+        self.capacity: float = max(capacity, 1.0)
+        self._tokens: float = self.capacity
+        self._updated_at: float = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.capacity, self._tokens + (now - self._updated_at) * self.rate
+                )
+                self._updated_at = now
+
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+
+                wait_time = (1 - self._tokens) / self.rate
+
+            time.sleep(wait_time)
@@ -1,60 +1,441 @@
 import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import closing, nullcontext
 from datetime import datetime
 from pathlib import Path
-from typing import List
+from typing import (
+    Dict,
+    Generic,
+    Iterator,
+    List,
+    Optional,
+    Protocol,
+    Tuple,
+    TypeVar,
+)
 
-from src.api import Api, WorkoutSummary
-from src.exporters.base_exporter import BaseExporter, parse_points
+from src.api import WorkoutApi, WorkoutHistory, WorkoutSummary
+from src.exporters.base_exporter import (
+    BaseDatasetWriter,
+    BaseExporter,
+    ExportableTrack,
+    parse_points_json,
+)
+from src.exporters.detail_stream import parse_points_stream
+from src.filters import SummaryFilter
+from src.metrics import Metrics
+from src.pipeline import Stage, run_pipeline
+from src.profiler import WorkoutProfiler
+from src.sync_state import SyncState
 
 LOGGER = logging.getLogger(__name__)
 
+DATASET_FILE_NAME = "workouts"
+REPORT_FILE_NAME = ".run_report.json"
+
+
+def _get_size(path: Path) -> int:
+    if path.is_dir():
+        return sum(p.stat().st_size for p in path.rglob("*") if p.is_file())
+    return path.stat().st_size if path.exists() else 0
+
+
+class _MeteredApi(Protocol):
+    metrics: Metrics
+
+
+ApiT = TypeVar("ApiT", bound=_MeteredApi)
+
+
+class BaseScraper(Generic[ApiT]):
+    """Selects, parses and writes the workouts of an API, Scraper and AsyncScraper
+    add the ways of fetching them."""
 
-class Scraper:
     def __init__(
-        self, api: Api, exporter: BaseExporter, output_dir: Path, file_format: str
+        self,
+        api: ApiT,
+        exporters: Dict[str, BaseExporter],
+        output_dir: Path,
+        workers: int = 1,
+        incremental: bool = False,
+        single_dataset: bool = False,
+        parse_processes: int = 0,
+        writers: int = 1,
+        queue_size: int = 16,
+        profiler: Optional[WorkoutProfiler] = None,
+        summary_filter: Optional[SummaryFilter] = None,
+        stream_details: bool = False,
     ):
-        self.api: Api = api
-        self.exporter: BaseExporter = exporter
+        self.api: ApiT = api
+        # Maps every requested file format to the exporter writing it
+        self.exporters: Dict[str, BaseExporter] = exporters
         self.output_dir: Path = output_dir
-        self.file_format: str = file_format
+        self.workers: int = max(workers, 1)
+        self.parse_processes: int = max(parse_processes, 0)
+        self.writers: int = max(writers, 1)
+        self.queue_size: int = max(queue_size, 1)
+        self.sync_state: Optional[SyncState] = (
+            SyncState(output_dir) if incremental else None
+        )
+        self.single_dataset: bool = single_dataset
+        self.datasets: Dict[str, BaseDatasetWriter] = {}
+        self._parse_pool: Optional[ProcessPoolExecutor] = None
+        # Shared with the API, so the report covers the requests as well
+        self.metrics: Metrics = api.metrics
+        self.profiler: Optional[WorkoutProfiler] = profiler
+        self.summary_filter: SummaryFilter = summary_filter or SummaryFilter()
+        # Details are decoded while they are downloaded instead of being buffered
+        # and parsed in the parse processes
+        self.stream_details: bool = stream_details
+        # Whether the history paged by the run reached the end or the watermark,
+        # whether the filter left out any of its workouts, and its newest workout
+        self._history_complete: bool = False
+        self._history_filtered: bool = False
+        self._newest_track_id: Optional[int] = None
 
-    def get_output_file_path(self, file_name: str) -> Path:
-        return (self.output_dir / file_name).with_suffix(f".{self.file_format}")
+    @property
+    def file_formats(self) -> List[str]:
+        return list(self.exporters)
 
-    def fetch_workout_summaries(self) -> List[WorkoutSummary]:
-        summaries: List[WorkoutSummary] = []
+    def get_output_file_path(self, file_name: str, file_format: str) -> Path:
+        return (self.output_dir / file_name).with_suffix(f".{file_format}")
+
+    def is_synced(self, summary: WorkoutSummary) -> bool:
+        return self.sync_state is not None and all(
+            self.sync_state.is_synced(summary, file_format)
+            for file_format in self.file_formats
+        )
+
+    def is_page_synced(self, history: WorkoutHistory) -> bool:
+        # The history is ordered from the newest workout, so once a whole synced page
+        # is below the watermark, the remaining pages have been synced as well. A
+        # synced page above it may be followed by workouts which failed or which an
+        # interrupted run never reached.
+        watermark = self.sync_state.watermark if self.sync_state else None
+        return watermark is not None and all(
+            int(summary.trackid) <= watermark and self.is_synced(summary)
+            for summary in history.data.summary
+        )
+
+    def start_paging(self) -> None:
+        self._history_complete = False
+        self._history_filtered = False
+        self._newest_track_id = None
+
+    def end_paging(self) -> None:
+        """Records that the run has paged the history down to its end or to the
+        watermark."""
+        self._history_complete = True
+
+    def update_watermark(self, failed: int) -> None:
+        """Moves the watermark up to the newest workout once a run has exported
+        every workout of the history."""
+        if (
+            self.sync_state
+            and self._history_complete
+            and not self._history_filtered
+            and not failed
+            and self._newest_track_id is not None
+        ):
+            self.sync_state.watermark = max(
+                self._newest_track_id, self.sync_state.watermark or 0
+            )
+
+    def select_summaries(
+        self, history: WorkoutHistory, selected: int
+    ) -> Tuple[List[WorkoutSummary], bool]:
+        """Returns the summaries of the page passing the filter, and whether the
+        remaining pages can be skipped."""
+        summaries, done = self.summary_filter.select(history.data.summary, selected)
+        self.metrics.increment(
+            "workouts_filtered", len(history.data.summary) - len(summaries)
+        )
+
+        if done or len(summaries) < len(history.data.summary):
+            self._history_filtered = True
+        if history.data.summary:
+            newest = max(int(summary.trackid) for summary in history.data.summary)
+            self._newest_track_id = max(newest, self._newest_track_id or 0)
+        if done:
+            logging.info("Reached the last selected workout, stopping pagination")
+        return summaries, done
+
+    def _profile(self, summary: WorkoutSummary):
+        return self.profiler.profile(summary) if self.profiler else nullcontext()
+
+    def parse_detail(
+        self, summary: WorkoutSummary, detail: bytes
+    ) -> Optional[ExportableTrack]:
+        with self.metrics.time("parse"), self._profile(summary):
+            if self._parse_pool:
+                track = self._parse_pool.submit(
+                    parse_points_json, summary, detail
+                ).result()
+            else:
+                track = parse_points_json(summary, detail)
+
+        return self.check_track(summary, track)
+
+    def check_track(
+        self, summary: WorkoutSummary, track: ExportableTrack
+    ) -> Optional[ExportableTrack]:
+        if not track:
+            if self.profiler:
+                self.profiler.finish(summary, 0)
+            self.metrics.increment("workouts_skipped")
+            LOGGER.warning(
+                f"Skipping workout {summary.trackid} because it has no points"
+            )
+            if self.sync_state:
+                for file_format in self.file_formats:
+                    self.sync_state.mark_synced(summary, file_format, None)
+            return None
+
+        self.metrics.increment("points_parsed", len(track))
+        return track
+
+    def write_track(
+        self, summary: WorkoutSummary, track: ExportableTrack
+    ) -> List[Path]:
+        track_id = int(summary.trackid)
+        file_name = datetime.fromtimestamp(track_id).strftime(
+            "Workout--%Y-%m-%d--%H-%M-%S"
+        )
+
+        output_file_paths: Dict[str, Path] = {
+            file_format: self.get_output_file_path(
+                DATASET_FILE_NAME if file_format in self.datasets else file_name,
+                file_format,
+            )
+            for file_format in self.file_formats
+        }
+
+        # The formats of the same exporter are written together, so it can share
+        # the work between them
+        exports: Dict[BaseExporter, List[Path]] = {}
+        for file_format, exporter in self.exporters.items():
+            if file_format not in self.datasets:
+                exports.setdefault(exporter, []).append(output_file_paths[file_format])
+
+        try:
+            with self.metrics.time("write"), self._profile(summary):
+                for dataset in self.datasets.values():
+                    dataset.write(summary, track)
+                for exporter, file_paths in exports.items():
+                    exporter.export_many(file_paths, summary, track)
+        except Exception:
+            self.metrics.increment("points_dropped", len(track))
+            if self.profiler:
+                self.profiler.finish(summary, len(track), failed=True)
+            raise
+
+        if self.profiler:
+            self.profiler.finish(summary, len(track))
+        self.metrics.increment("workouts_exported")
+        self.metrics.increment("points_written", len(track))
+
+        for file_format, output_file_path in output_file_paths.items():
+            is_dataset = file_format in self.datasets
+            if not is_dataset:
+                self.metrics.increment("files_written")
+                self.metrics.increment("bytes_written", _get_size(output_file_path))
+
+            if self.sync_state:
+                # The shared dataset changes with every workout, hashing it is
+                # pointless
+                self.sync_state.mark_synced(
+                    summary,
+                    file_format,
+                    output_file_path,
+                    hash_content=not is_dataset,
+                )
+
+            LOGGER.info(f"Downloaded {output_file_path}")
 
-        history = self.api.get_workout_history()
-        summaries.extend(history.data.summary)
+        return list(output_file_paths.values())
+
+    def open_outputs(self) -> None:
+        self.output_dir.mkdir(exist_ok=True)
+        assert self.output_dir.exists(), "Couldn't create output folder"
+
+        # Formats which can't hold several workouts are still written per workout
+        if self.single_dataset:
+            self.datasets = {
+                file_format: exporter.open_dataset(
+                    self.get_output_file_path(DATASET_FILE_NAME, file_format)
+                )
+                for file_format, exporter in self.exporters.items()
+                if file_format in exporter.get_dataset_file_formats()
+            }
+
+    def close_outputs(self) -> None:
+        for file_format, dataset in self.datasets.items():
+            dataset.close()
+            self.metrics.increment("files_written")
+            self.metrics.increment(
+                "bytes_written",
+                _get_size(self.get_output_file_path(DATASET_FILE_NAME, file_format)),
+            )
+        self.datasets = {}
+        if self.sync_state:
+            self.sync_state.save()
+
+        if self.profiler:
+            self.profiler.dump()
+
+        report_path = self.output_dir / REPORT_FILE_NAME
+        self.metrics.write_report(report_path)
+        LOGGER.info(f"Run report written to {report_path}")
+
+    def create_parse_pool(self):
+        # Workers are spawned instead of forked, as forking a process running
+        # threads isn't safe
+        return (
+            ProcessPoolExecutor(
+                max_workers=self.parse_processes,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+            if self.parse_processes and not self.profiler and not self.stream_details
+            else nullcontext()
+        )
+
+    def record_failure(self, summary: WorkoutSummary) -> None:
+        self.metrics.increment("workouts_failed")
+        # A workout failing to parse or write is still profiled, it may well be
+        # the slowest one
+        if self.profiler:
+            self.profiler.finish(summary, 0, failed=True)
+
+    def log_results(self, count: int, failed: int) -> None:
+        if self.sync_state:
+            logging.info(f"There were {count} new or changed workouts")
+
+        if failed:
+            LOGGER.error(f"Failed to export {failed} of {count} workouts")
+
+
+class Scraper(BaseScraper[WorkoutApi]):
+    """Exports the workouts through a pipeline of threads, fetching, parsing and
+    writing overlap."""
+
+    def iter_workout_summaries(self) -> Iterator[WorkoutSummary]:
+        """Yields the summaries passing the filter as the history pages arrive,
+        newest first."""
+        count = 0
+        selected = 0
+        self.start_paging()
+
+        for history in self.api.iter_workout_history():
+            # It's checked before yielding, as the page is exported meanwhile
+            page_synced = self.is_page_synced(history)
+            summaries, done = self.select_summaries(history, selected)
+
+            count += len(history.data.summary)
+            selected += len(summaries)
+            yield from summaries
+
+            if history.data.next == -1 or done:
+                self.end_paging()
+                break
+            if page_synced:
+                logging.info("Reached already synced workouts, stopping pagination")
+                self.end_paging()
+                break
 
-        while history.data.next != -1:
             logging.info(
                 f"Fetching more summaries starting from workout {history.data.next}"
             )
-            history = self.api.get_workout_history(from_track_id=history.data.next)
-            summaries.extend(history.data.summary)
 
-        logging.info(f"There are {len(summaries)} workouts in total")
-        return summaries
+        logging.info(f"There are {count} workouts in total, {selected} selected")
+
+    def fetch_workout_summaries(self) -> List[WorkoutSummary]:
+        return list(self.iter_workout_summaries())
+
+    def fetch_detail(self, summary: WorkoutSummary, _=None) -> bytes:
+        with self.metrics.time("fetch"):
+            return self.api.get_workout_detail_raw(summary)
+
+    def stream_detail(
+        self, summary: WorkoutSummary, _=None
+    ) -> Optional[ExportableTrack]:
+        # Downloading and decoding overlap, so both are timed as the fetch
+        # Closing the chunks closes the response when decoding fails midway
+        with (
+            self.metrics.time("fetch"),
+            self._profile(summary),
+            closing(self.api.iter_workout_detail_raw(summary)) as chunks,
+        ):
+            track = parse_points_stream(summary, chunks)
+
+        return self.check_track(summary, track)
+
+    def export_workout(self, summary: WorkoutSummary) -> List[Path]:
+        if self.stream_details:
+            track = self.stream_detail(summary)
+        else:
+            track = self.parse_detail(summary, self.fetch_detail(summary))
+
+        if not track:
+            return []
+
+        return self.write_track(summary, track)
+
+    def get_stages(self) -> List[Stage]:
+        if self.profiler:
+            # Profiles would mix the calls of concurrently processed workouts, so
+            # they are exported one by one while profiling
+            return [Stage("export", lambda summary, _: self.export_workout(summary), 1)]
+
+        if self.stream_details:
+            return [
+                Stage("fetch", self.stream_detail, self.workers),
+                Stage("write", self.write_track, self.writers),
+            ]
+
+        return [
+            Stage("fetch", self.fetch_detail, self.workers),
+            Stage("parse", self.parse_detail, self.parse_processes),
+            Stage("write", self.write_track, self.writers),
+        ]
 
     def run(self) -> None:
-        for summary in self.fetch_workout_summaries():
-            detail = self.api.get_workout_detail(summary)
+        self.open_outputs()
 
-            if not (points := parse_points(summary, detail.data)):
-                LOGGER.warning(
-                    f"Skipping workout {summary.trackid} because it has no points"
-                )
-                continue
+        count = 0
+        failed = 0
+        failed_lock = threading.Lock()
 
-            track_id = int(summary.trackid)
-            file_name = datetime.fromtimestamp(track_id).strftime(
-                "Workout--%Y-%m-%d--%H-%M-%S"
-            )
+        # Summaries are exported while the following history pages are still being
+        # fetched, instead of collecting the whole history first
+        def iter_new_summaries() -> Iterator[WorkoutSummary]:
+            nonlocal count
+            for summary in self.iter_workout_summaries():
+                if not self.is_synced(summary):
+                    count += 1
+                    yield summary
 
-            output_file_path = self.get_output_file_path(file_name)
-            output_file_path.parent.mkdir(exist_ok=True)
-            assert output_file_path.parent.exists(), "Couldn't create output folder"
+        def on_error(stage: Stage, summary: WorkoutSummary):
+            nonlocal failed
+            with failed_lock:
+                failed += 1
+            self.record_failure(summary)
+            LOGGER.exception(f"Failed to {stage.name} workout {summary.trackid}")
 
-            self.exporter.export(output_file_path, summary, points)
-            LOGGER.info(f"Downloaded {output_file_path}")
+        try:
+            with self.create_parse_pool() as self._parse_pool:
+                # Downloads, parsing and writing overlap, every stage waits when
+                # the next one falls behind so at most a few workouts are in memory
+                run_pipeline(
+                    iter_new_summaries(),
+                    self.get_stages(),
+                    self.queue_size,
+                    on_error,
+                )
+            self.update_watermark(failed)
+        finally:
+            self._parse_pool = None
+            self.close_outputs()
+
+        self.log_results(count, failed)
@@ -0,0 +1,152 @@
+import hashlib
+import json
+import logging
+import threading
+from pathlib import Path
+from typing import Dict, Optional
+
+from pydantic import BaseModel
+
+from src.api import WorkoutSummary
+
+LOGGER = logging.getLogger(__name__)
+
+
+class SyncedWorkout(BaseModel):
+    trackid: str
+    source: str
+    version: int
+    file_format: str
+    file_name: str
+    content_hash: str
+    # Stat of the file when it was hashed, its hash is only computed again when
+    # they change
+    size: int = 0
+    mtime_ns: int = 0
+
+
+def _get_key(trackid: str, source: str, file_format: str) -> str:
+    return f"{trackid}:{source}:{file_format}"
+
+
+def _hash_file(path: Path) -> str:
+    digest = hashlib.sha256()
+    with path.open("rb") as fp:
+        while chunk := fp.read(1 << 20):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class SyncState:
+    """Index of already exported workouts, persisted as JSON in the output folder.
+
+    The watermark is the newest track ID of the last run which paged the whole
+    history and exported every workout, so every workout up to it is synced.
+    """
+
+    FILE_NAME = ".sync_state.json"
+
+    def __init__(self, output_dir: Path):
+        self.path: Path = output_dir / self.FILE_NAME
+        self.output_dir: Path = output_dir
+        self._workouts: Dict[str, SyncedWorkout] = {}
+        self.watermark: Optional[int] = None
+        self._lock = threading.Lock()
+
+        if self.path.exists():
+            data = json.loads(self.path.read_text())
+            # Files of the first version only hold the workouts
+            if "workouts" in data:
+                self.watermark = data["watermark"]
+                data = data["workouts"]
+            self._workouts = {
+                key: SyncedWorkout(**value) for key, value in data.items()
+            }
+            LOGGER.info(
+                f"Loaded {len(self._workouts)} synced workouts from {self.path}"
+            )
+
+    def is_synced(self, summary: WorkoutSummary, file_format: str) -> bool:
+        with self._lock:
+            workout = self._workouts.get(
+                _get_key(summary.trackid, summary.source, file_format)
+            )
+
+        # Workouts without points are recorded without a file name
+        return (
+            workout is not None
+            and workout.version == summary.version
+            and (not workout.file_name or self._is_file_intact(workout))
+        )
+
+    def _is_file_intact(self, workout: SyncedWorkout) -> bool:
+        """Checks that the exported file still has the content it was written with,
+        so changed or corrupted files are exported again."""
+        path = self.output_dir / workout.file_name
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            return False
+
+        # Shared datasets change with every workout and aren't hashed
+        if not workout.content_hash or (
+            stat.st_size == workout.size and stat.st_mtime_ns == workout.mtime_ns
+        ):
+            return True
+
+        if _hash_file(path) != workout.content_hash:
+            LOGGER.info(f"{path} has changed since it was exported")
+            return False
+
+        # Only touched, the new stat spares hashing it on the next run
+        with self._lock:
+            self._workouts[
+                _get_key(workout.trackid, workout.source, workout.file_format)
+            ] = workout.model_copy(
+                update={"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+            )
+        return True
+
+    def mark_synced(
+        self,
+        summary: WorkoutSummary,
+        file_format: str,
+        output_file_path: Optional[Path],
+        hash_content: bool = True,
+    ) -> None:
+        content_hash = ""
+        size = mtime_ns = 0
+        if output_file_path and hash_content:
+            stat = output_file_path.stat()
+            content_hash = _hash_file(output_file_path)
+            size, mtime_ns = stat.st_size, stat.st_mtime_ns
+
+        workout = SyncedWorkout(
+            trackid=summary.trackid,
+            source=summary.source,
+            version=summary.version,
+            file_format=file_format,
+            file_name=output_file_path.name if output_file_path else "",
+            content_hash=content_hash,
+            size=size,
+            mtime_ns=mtime_ns,
+        )
+
+        with self._lock:
+            self._workouts[_get_key(summary.trackid, summary.source, file_format)] = (
+                workout
+            )
+
+    def save(self) -> None:
+        with self._lock:
+            data = {
+                "watermark": self.watermark,
+                "workouts": {
+                    key: value.model_dump() for key, value in self._workouts.items()
+                },
+            }
+
+        # Write to a temporary file first so an interrupted run can't corrupt the index
+        tmp_path = self.path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(data, indent=1))
+        tmp_path.replace(self.path)
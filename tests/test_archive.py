@@ -0,0 +1,79 @@
+import logging
+import zipfile
+
+from src.archive import ArchiveApi
+from src.exporters.base_exporter import parse_points_json
+
+SPORT_TABLE = """startTime,sportTime(s),distance(m),type
+2024-05-01T08:00:00,120,500,1
+1714636800,60,200,6
+"""
+
+POINT_TABLE = """trackId,timestamp,latitude,longitude,altitude(m),heartRate
+1714550400,1714550400,48.1,11.5,520,90
+1714550400,1714550460,48.2,11.6,,95
+1714550400,not a time,48.3,11.7,,
+1714550400,1714550430,48.15,11.55,521,
+"""
+
+
+def write_archive(path, tables):
+    with zipfile.ZipFile(path, "w") as archive:
+        for name, table in tables.items():
+            archive.writestr(name, table)
+    return path
+
+
+def test_archive_serves_its_workouts_like_the_api(tmp_path, caplog):
+    path = write_archive(
+        tmp_path / "export.zip",
+        {"SPORT/SPORT.csv": SPORT_TABLE, "GPS/GPS.csv": POINT_TABLE},
+    )
+
+    with caplog.at_level(logging.WARNING):
+        api = ArchiveApi(path, page_size=1)
+
+    pages = list(api.iter_workout_history())
+    assert [[summary.trackid for summary in page.data.summary] for page in pages] == [
+        ["1714636800"],
+        ["1714550400"],
+    ]
+    assert [page.data.next for page in pages] == [1714550400, -1]
+
+    summary = pages[1].data.summary[0]
+    assert (summary.end_time, summary.dis, summary.type) == ("1714550520", "500", 1)
+    track = parse_points_json(summary, api.get_workout_detail_raw(summary))
+    assert list(track.time) == [1714550400, 1714550430, 1714550460]
+    assert [round(lat, 2) for lat in track.latitude] == [48.1, 48.15, 48.2]
+    assert list(track.heart_rate)[0] == 90
+
+    # The newer workout has no points in the archive
+    empty = parse_points_json(
+        pages[0].data.summary[0],
+        api.get_workout_detail_raw(pages[0].data.summary[0]),
+    )
+    assert len(empty) == 0
+
+    assert [record.getMessage() for record in caplog.records] == [
+        "Skipped 1 invalid rows of GPS/GPS.csv"
+    ]
+
+
+def test_point_table_without_timestamps_is_skipped_with_one_warning(tmp_path, caplog):
+    path = write_archive(
+        tmp_path / "export.zip",
+        {
+            "SPORT/SPORT.csv": SPORT_TABLE,
+            "GPS/GPS.csv": "trackId,latitude,longitude\n"
+            + "1714550400,48.1,11.5\n" * 10,
+        },
+    )
+
+    with caplog.at_level(logging.WARNING):
+        api = ArchiveApi(path)
+
+    assert len(api.summaries) == 2
+    assert api.tracks == {}
+    assert [record.getMessage() for record in caplog.records] == [
+        "Skipping GPS/GPS.csv, it has no timestamp column"
+    ]
@@ -0,0 +1,27 @@
+import asyncio
+
+from benchmarks.mock_server import MockApiServer
+from src.async_api import AsyncApi, AsyncSession
+
+
+def test_accounts_share_the_session_and_send_their_own_token():
+    tokens = []
+
+    async def record_token(request):
+        tokens.append(request.headers["apptoken"])
+
+    async def run(endpoint: str) -> None:
+        async with AsyncSession(max_connections_per_host=2) as session:
+            session.client.event_hooks["request"].append(record_token)
+            apis = [AsyncApi(endpoint, token, session=session) for token in "ab"]
+            for api in apis:
+                await api.get_workout_history()
+                await api.aclose()
+
+            assert not session.client.is_closed
+            assert len(session._host_limits) == 1
+
+    with MockApiServer(num_workouts=2) as server:
+        asyncio.run(run(server.endpoint))
+
+    assert tokens == ["a", "b"]
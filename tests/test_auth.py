@@ -0,0 +1,21 @@
+import stat
+import sys
+
+import pytest
+
+from src.auth import TokenCache
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="POSIX permissions")
+@pytest.mark.parametrize("existing", [False, True])
+def test_saved_token_is_only_readable_by_the_user(tmp_path, existing: bool):
+    path = tmp_path / "token.json"
+    if existing:
+        path.write_text("{}")
+        path.chmod(0o644)
+
+    token_cache = TokenCache(path)
+    token_cache.save("token", expires_at=None)
+
+    assert stat.S_IMODE(path.stat().st_mode) == 0o600
+    assert token_cache.load() == "token"
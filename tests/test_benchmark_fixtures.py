@@ -0,0 +1,30 @@
+from benchmarks.fixtures import make_detail_data, make_summaries, make_summary
+from src.api import WorkoutHistory, WorkoutSummary
+from src.exporters.base_exporter import parse_points
+
+
+def test_summaries_are_valid():
+    summaries = make_summaries(3)
+
+    history = WorkoutHistory.model_validate(
+        {
+            "code": 1,
+            "message": "success",
+            "data": {
+                "next": -1,
+                "summary": [summary.model_dump() for summary in summaries],
+            },
+        }
+    )
+    assert history.data.summary == summaries
+    assert [int(summary.trackid) for summary in summaries] == sorted(
+        (int(summary.trackid) for summary in summaries), reverse=True
+    )
+
+
+def test_detail_is_parsed_into_a_track():
+    summary = make_summary(duration=600)
+    WorkoutSummary.model_validate(summary.model_dump())
+
+    track = parse_points(summary, make_detail_data(summary, 600, pause_ratio=0.01))
+    assert len(track) >= 600
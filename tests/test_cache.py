@@ -0,0 +1,67 @@
+import pytest
+
+from benchmarks.mock_server import MockApiServer
+from src.api import Api, _ResponseCodeReader
+from src.cache import CacheMissError, ResponseCache
+
+
+def test_accounts_sharing_a_cache_get_their_own_responses(tmp_path):
+    cache = ResponseCache(tmp_path)
+    with MockApiServer(num_workouts=2) as server:
+        summary = server.summaries[0]
+        api = Api(server.endpoint, "a", cache=cache, cache_namespace="a")
+        detail = api.get_workout_detail_raw(summary)
+        endpoint = server.endpoint
+
+    def create_offline_api(namespace: str, endpoint: str = endpoint) -> Api:
+        return Api(
+            endpoint, "", cache=cache, cache_only=True, cache_namespace=namespace
+        )
+
+    assert create_offline_api("a").get_workout_detail_raw(summary) == detail
+    with pytest.raises(CacheMissError):
+        create_offline_api("b").get_workout_detail_raw(summary)
+    with pytest.raises(CacheMissError):
+        create_offline_api("a", "http://other").get_workout_detail_raw(summary)
+    cache.close()
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_error_responses_are_not_cached(tmp_path, stream):
+    cache = ResponseCache(tmp_path)
+    with MockApiServer(num_workouts=1) as server:
+        summary = server.summaries[0]
+        api = Api(server.endpoint, "", cache=cache)
+
+        def get_detail() -> bytes:
+            if stream:
+                return b"".join(api.iter_workout_detail_raw(summary, chunk_size=7))
+            return api.get_workout_detail_raw(summary)
+
+        server.rejected_track_ids.add(summary.trackid)
+        assert b'"code": 0' in get_detail()
+        server.rejected_track_ids.clear()
+        assert b'"code": 1' in get_detail()
+        server.requests = 0
+        assert b'"code": 1' in get_detail()
+        assert server.requests == 0
+    cache.close()
+
+
+@pytest.mark.parametrize(
+    "body, success",
+    [
+        (b'{"code": 1, "message": "success", "data": {}}', True),
+        (b'{"data": {"code": 0, "a": [{"code": 0}]}, "code" : 1}', True),
+        (b'{"message": "\\"code\\": 1", "data": "\\\\", "code": 0}', False),
+        (b'{"code": "1"}', False),
+        (b'{"code": -1}', False),
+        (b"[]", False),
+    ],
+)
+def test_response_code_reader_reads_the_top_level_code(body, success):
+    for chunk_size in range(1, len(body) + 1):
+        reader = _ResponseCodeReader()
+        for i in range(0, len(body), chunk_size):
+            reader.feed(body[i : i + chunk_size])
+        assert reader.is_success() == success
@@ -0,0 +1,70 @@
+import json
+import random
+from typing import List
+
+import pytest
+
+from benchmarks.fixtures import make_detail_data, make_summary
+from src.exporters.base_exporter import ExportableTrack, parse_points_json
+from src.exporters.detail_stream import parse_points_stream
+
+SUMMARY = make_summary(duration=600)
+
+
+def make_body(rng: random.Random) -> bytes:
+    data = make_detail_data(
+        SUMMARY,
+        duration=rng.randint(1, 600),
+        sampling_interval=rng.randint(1, 5),
+        hr_interval=rng.randint(1, 5),
+        gait_interval=rng.randint(1, 10),
+        gap_ratio=rng.choice([0.0, 0.1]),
+        pause_ratio=rng.choice([0.0, 0.01]),
+        seed=rng.randrange(1 << 32),
+    ).model_dump()
+    # Skipped strings with escapes and non-ASCII characters
+    data["provider"] = 'Zepp "Ä" \\ é'
+    return json.dumps(
+        {"code": 1, "message": "success", "data": data},
+        indent=rng.choice([None, 1]),
+        ensure_ascii=rng.random() < 0.5,
+    ).encode()
+
+
+def split(body: bytes, rng: random.Random) -> List[bytes]:
+    max_size = rng.choice([1, 7, 64, 4096, len(body)])
+    chunks = []
+    while body:
+        size = rng.randint(1, max_size)
+        chunks.append(body[:size])
+        body = body[size:]
+    return chunks
+
+
+def as_lists(track: ExportableTrack) -> dict:
+    return {field: list(getattr(track, field)) for field in ExportableTrack.__slots__}
+
+
+@pytest.mark.parametrize("seed", range(30))
+def test_streamed_and_buffered_parsers_agree(seed: int):
+    rng = random.Random(seed)
+    body = make_body(rng)
+
+    expected = as_lists(parse_points_json(SUMMARY, body))
+    assert as_lists(parse_points_stream(SUMMARY, split(body, rng))) == expected
+
+
+@pytest.mark.parametrize(
+    "body",
+    [
+        b'{"code":0,"message":"invalid token"}',
+        b'{"code":1,"message":"success","data":null}',
+        b'{"code":1,"message":"success","data":{"time":"0;1"}}',
+        b'{"code":1,"message":"success","data":{"time":"0;1',
+    ],
+)
+def test_invalid_details_raise(body: bytes):
+    with pytest.raises(ValueError):
+        parse_points_json(SUMMARY, body)
+    with pytest.raises(ValueError):
+        parse_points_stream(SUMMARY, [body])
@@ -0,0 +1,66 @@
+from datetime import datetime, timezone
+
+from benchmarks.fixtures import START_TIME, make_summaries, make_summary
+from src.filters import INDOOR_WORKOUT_TYPES, SummaryFilter
+
+
+def make_pages(count: int, page_size: int):
+    summaries = make_summaries(count)
+    return [summaries[i : i + page_size] for i in range(0, count, page_size)]
+
+
+def select_all(summary_filter: SummaryFilter, pages) -> list:
+    """Selects the workouts of the pages like the scraper does, until done."""
+    selected = []
+    for page in pages:
+        summaries, done = summary_filter.select(page, len(selected))
+        selected.extend(summaries)
+        if done:
+            break
+    return [int(summary.trackid) for summary in selected]
+
+
+def test_paging_stops_at_since():
+    # Newest first, one workout a day
+    pages = make_pages(10, 3)
+    since = datetime.fromtimestamp(START_TIME + 5 * 86400, timezone.utc)
+    summary_filter = SummaryFilter(since=since)
+
+    assert select_all(summary_filter, pages) == [
+        START_TIME + i * 86400 for i in reversed(range(5, 10))
+    ]
+    # The second page holds the first workout before since
+    assert summary_filter.select(pages[1], 3) == (pages[1][:2], True)
+
+
+def test_limit_spans_pages():
+    pages = make_pages(10, 3)
+
+    assert select_all(SummaryFilter(limit=4), pages) == [
+        START_TIME + i * 86400 for i in reversed(range(6, 10))
+    ]
+    assert SummaryFilter(limit=3).select(pages[0], 0) == (pages[0], True)
+
+
+def test_type_filters():
+    summaries = []
+    for workout_type in [1, 8, 9, 23, 92]:
+        summary = make_summary()
+        summary.type = workout_type
+        summaries.append(summary)
+
+    def select_types(summary_filter: SummaryFilter) -> list:
+        matching, done = summary_filter.select(summaries)
+        assert not done
+        return [summary.type for summary in matching]
+
+    assert select_types(SummaryFilter(types=[1, 23])) == [1, 23]
+    assert select_types(SummaryFilter(outdoor_only=True)) == [1, 9]
+    assert INDOOR_WORKOUT_TYPES == {8, 10, 23, 92}
+
+
+def test_min_distance():
+    summary = make_summary()
+
+    assert SummaryFilter(min_distance=10000).matches(summary)
+    assert not SummaryFilter(min_distance=10001).matches(summary)
@@ -0,0 +1,20 @@
+import geopandas as gpd
+import pandas as pd
+import pytest
+
+from benchmarks.fixtures import START_TIME, make_summary, make_track
+from src.exporters.geopandas_exporter import GeoPandasExporter
+
+
+@pytest.mark.parametrize("file_format", ["shp", "gpkg", "csv"])
+def test_timestamps_keep_the_time_of_day(tmp_path, file_format: str):
+    output_file_path = tmp_path / f"workout.{file_format}"
+    GeoPandasExporter().export(output_file_path, make_summary(), make_track(10))
+
+    if file_format == "csv":
+        timestamps = pd.read_csv(output_file_path)["timestamp"]
+    else:
+        timestamps = gpd.read_file(output_file_path)["timestamp"]
+
+    seconds = (pd.to_datetime(timestamps) - pd.Timestamp(0)).dt.total_seconds()
+    assert seconds.tolist() == [START_TIME + i for i in range(10)]
@@ -0,0 +1,39 @@
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+
+# Only needed once a workout is parsed, exported to a geopandas format, or the
+# token is obtained through the browser
+HEAVY_MODULES = ["geopandas", "pandas", "shapely", "playwright", "numpy"]
+
+
+def get_loaded_modules(file_format: str) -> list:
+    """Imports what main.py imports and resolves the exporter of the format in a
+    fresh interpreter, and returns the heavy modules loaded by then."""
+    script = (
+        "import json, sys\n"
+        "import main\n"
+        "from src.exporters.registry import ExporterRegistry\n"
+        "if sys.argv[1]:\n"
+        "    ExporterRegistry().get_exporter(sys.argv[1])\n"
+        f"print(json.dumps([name for name in {HEAVY_MODULES!r} "
+        "if name in sys.modules]))\n"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", script, file_format],
+        cwd=ROOT_DIR,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return json.loads(output)
+
+
+@pytest.mark.parametrize("file_format", ["", "gpx"])
+def test_startup_does_not_import_heavy_modules(file_format: str):
+    assert get_loaded_modules(file_format) == []
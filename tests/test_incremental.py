@@ -0,0 +1,40 @@
+from pathlib import Path
+
+from benchmarks.mock_server import MockApiServer
+from src.api import Api
+from src.exporters.registry import ExporterRegistry
+from src.scraper import Scraper
+
+
+def run_scraper(server: MockApiServer, output_dir: Path) -> int:
+    """Runs an incremental export and returns the number of exported files."""
+    api = Api(server.endpoint, "token", max_retries=0)
+    Scraper(
+        api,
+        {"gpx": ExporterRegistry().get_exporter("gpx")},
+        output_dir,
+        workers=2,
+        incremental=True,
+    ).run()
+    return len(list(output_dir.glob("*.gpx")))
+
+
+def test_workouts_failed_below_a_synced_page_are_exported_again(tmp_path):
+    with MockApiServer(num_workouts=60, page_size=20, duration=60) as server:
+        # A workout of the second page
+        server.failing_track_ids.add(server.summaries[30].trackid)
+        assert run_scraper(server, tmp_path) == 59
+
+        server.failing_track_ids.clear()
+        assert run_scraper(server, tmp_path) == 60
+
+
+def test_complete_runs_stop_paging_at_synced_pages(tmp_path):
+    with MockApiServer(num_workouts=60, page_size=20, duration=60) as server:
+        assert run_scraper(server, tmp_path) == 60
+
+        server.requests = 0
+        assert run_scraper(server, tmp_path) == 60
+        # The first page of the history and maybe the prefetched second one, no
+        # detail
+        assert server.requests <= 2
@@ -0,0 +1,223 @@
+import array
+import random
+from bisect import bisect_left
+from itertools import accumulate
+
+import pytest
+
+from src.exporters import base_exporter
+from src.exporters.base_exporter import (
+    NO_VALUE,
+    RawTrackData,
+    interpolate_columns,
+    interpolate_data,
+    merge_times,
+)
+
+
+class Interpolate(object):
+    """The former per-point implementation, kept as the reference."""
+
+    def __init__(self, x_list, y_list):
+        intervals = zip(x_list, x_list[1:], y_list, y_list[1:])
+        self.x_list = x_list
+        self.y_list = y_list
+        self.slopes = [(y2 - y1) // ((x2 - x1) or 1) for x1, x2, y1, y2 in intervals]
+
+    def __getitem__(self, x):
+        i = bisect_left(self.x_list, x) - 1
+        if i >= len(self.slopes):
+            return self.y_list[-1]
+        if i < 0:
+            return self.y_list[0]
+        return self.y_list[i] + self.slopes[i] * (x - self.x_list[i])
+
+
+def reference_interpolate_column(data, original_points, new_points):
+    data = array.array("q", data)
+    old_value = NO_VALUE
+    for old_value in data:
+        if old_value != NO_VALUE:
+            break
+    for i, value in enumerate(data):
+        if value == NO_VALUE:
+            data[i] = old_value
+        else:
+            old_value = value
+
+    if len(new_points) == 0:
+        return array.array("q", [])
+    if len(original_points) == 0:
+        return array.array("q", [0] * len(new_points))
+    if len(original_points) == 1:
+        return array.array("q", [original_points[0]] * len(new_points))
+    interpolate = Interpolate(original_points, data)
+    return array.array("q", (interpolate[point] for point in new_points))
+
+
+def make_case(seed: int):
+    rng = random.Random(seed)
+    num_points = rng.choice([0, 1, 2, 3, 10, 200])
+    original_points = sorted(rng.randint(0, 500) for _ in range(num_points))
+    new_points = sorted(rng.randint(-20, 520) for _ in range(rng.randint(0, 300)))
+    # Columns are sometimes longer or shorter than their timeline
+    columns = [
+        [
+            NO_VALUE if rng.random() < 0.2 else rng.randint(-(10**9), 10**9)
+            for _ in range(max(num_points + rng.randint(-2, 2), 1))
+        ]
+        for _ in range(3)
+    ]
+    return columns, original_points, new_points
+
+
+CASES = [make_case(seed) for seed in range(200)] + [
+    # Leading, trailing and repeated missing values
+    ([[NO_VALUE, NO_VALUE, 5, NO_VALUE, 9, NO_VALUE]], [0, 2, 4, 6, 8, 10], [1, 5]),
+    # Only missing values
+    ([[NO_VALUE, NO_VALUE]], [0, 10], [0, 3, 10]),
+    # Repeated times and negative slopes rounded towards minus infinity
+    ([[10, 3, -7, 2]], [0, 0, 3, 7], [-1, 0, 1, 2, 5, 7, 8]),
+]
+
+
+@pytest.fixture(params=["numpy", "python"])
+def engine(request, monkeypatch):
+    if request.param == "python":
+        monkeypatch.setattr(base_exporter, "get_numpy", lambda: None)
+    elif base_exporter.get_numpy() is None:
+        pytest.skip("NumPy isn't installed")
+    return request.param
+
+
+@pytest.mark.parametrize("columns, original_points, new_points", CASES)
+def test_interpolate_columns_matches_the_reference(
+    engine, columns, original_points, new_points
+):
+    results = interpolate_columns(columns, original_points, new_points)
+
+    assert [list(result) for result in results] == [
+        list(reference_interpolate_column(data, original_points, new_points))
+        for data in columns
+    ]
+
+
+def reference_interpolate_data(track_data):
+    """The former timeline merge and gap trimming loop, kept as the reference. It
+    stops when no interval can be shortened, where the former loop never ended."""
+    track_times = array.array("q", accumulate(track_data.times))
+    hr_times = array.array("q", accumulate(track_data.hrtimes))
+    step_times = array.array("q", accumulate(track_data.steptimes))
+
+    def change_times(times, change, time_from):
+        return array.array(
+            "q", (time + change if time >= time_from else time for time in times)
+        )
+
+    times = list(sorted(set(track_times).union(hr_times).union(step_times)))
+
+    time_to_trim = (times[-1] - track_data.cost_time) if track_times else 0
+    while time_to_trim > 0:
+        max_time = 0
+        max_interval = 0
+        last_time = 0
+        for time in times:
+            current_interval = time - last_time
+            last_time = time
+            if current_interval > max_interval:
+                max_interval = current_interval
+                max_time = time
+        time_change = max(max_interval - time_to_trim, 1) - max_interval
+        if time_change == 0:
+            break
+        track_times = change_times(track_times, time_change, max_time)
+        hr_times = change_times(hr_times, time_change, max_time)
+        step_times = change_times(step_times, time_change, max_time)
+        time_to_trim += time_change
+        times = list(sorted(set(track_times).union(hr_times).union(step_times)))
+
+    lat, lon, alt = interpolate_columns(
+        [accumulate(track_data.lat), accumulate(track_data.lon), track_data.alt],
+        track_times,
+        times,
+    )
+    (hr,) = interpolate_columns([accumulate(track_data.hr)], hr_times, times)
+    stride, cadence = interpolate_columns(
+        [track_data.stride, track_data.cadence], step_times, times
+    )
+    return times, lat, lon, alt, hr, stride, cadence
+
+
+def make_timeline(rng: random.Random, num_points: int, pause_ratio: float):
+    # Mostly one second steps, with repeated times, pauses and, rarely, a negative
+    # delta leaving the stream unsorted
+    deltas = []
+    for _ in range(num_points):
+        if rng.random() < pause_ratio:
+            deltas.append(rng.randint(2, 600))
+        elif rng.random() < 0.01:
+            deltas.append(-rng.randint(1, 5))
+        else:
+            deltas.append(rng.choice([0, 1, 1, 1, 2]))
+    return deltas
+
+
+def make_track_data(seed: int):
+    rng = random.Random(seed)
+    num_points = rng.choice([1, 2, 10, 300])
+    pause_ratio = rng.choice([0.0, 0.05, 0.3])
+    times = make_timeline(rng, num_points, pause_ratio)
+    hrtimes = make_timeline(rng, rng.randint(0, num_points), pause_ratio)
+    steptimes = make_timeline(rng, rng.randint(0, num_points), pause_ratio)
+
+    def column(length):
+        return [rng.randint(-1000, 1000) for _ in range(length)]
+
+    duration = max(accumulate(times + hrtimes + steptimes))
+    return RawTrackData(
+        start_time=0,
+        end_time=duration,
+        # Sometimes there's nothing to trim, sometimes far more than can be
+        cost_time=max(int(duration * rng.choice([0.1, 0.5, 0.9, 1.2])), 1),
+        distance=0.0,
+        times=times,
+        lat=column(len(times)),
+        lon=column(len(times)),
+        alt=column(len(times)),
+        hrtimes=hrtimes,
+        hr=column(len(hrtimes)),
+        steptimes=steptimes,
+        stride=column(len(steptimes)),
+        cadence=column(len(steptimes)),
+    )
+
+
+@pytest.mark.parametrize("seed", range(200))
+def test_merge_times_matches_sorting_the_union(seed):
+    track_data = make_track_data(seed)
+    streams = [
+        array.array("q", accumulate(times))
+        for times in (track_data.times, track_data.hrtimes, track_data.steptimes)
+    ]
+
+    assert list(merge_times(*streams)) == sorted(set().union(*streams))
+
+
+@pytest.mark.parametrize("seed", range(200))
+def test_interpolate_data_with_fixed_gaps_matches_the_reference(engine, seed):
+    track_data = make_track_data(seed)
+
+    result = interpolate_data(track_data, fix_gaps=True)
+
+    columns = [
+        result.times,
+        result.lat,
+        result.lon,
+        result.alt,
+        result.hr,
+        result.stride,
+        result.cadence,
+    ]
+    assert [list(column) for column in columns] == [
+        list(column) for column in reference_interpolate_data(track_data)
+    ]
@@ -0,0 +1,88 @@
+import sqlite3
+
+from benchmarks.fixtures import make_summary
+from src.job_queue import EXPORTED, FAILED, PENDING, UNCLAIMED_JOBS, JobQueue
+
+
+def make_queue(tmp_path, accounts):
+    job_queue = JobQueue(tmp_path / "jobs.sqlite3")
+    for account, track_ids in accounts.items():
+        job_queue.add_account(account)
+        job_queue.add_page(
+            account, [make_summary(track_id) for track_id in track_ids], -1
+        )
+    job_queue.start_run()
+    return job_queue
+
+
+def claim_all(job_queue):
+    claimed = []
+    while job := job_queue.claim():
+        claimed.append((job.account, int(job.summary.trackid)))
+    return claimed
+
+
+def test_claim_hands_out_every_job_once(tmp_path):
+    job_queue = make_queue(tmp_path, {"a": [1, 2, 3], "b": [4, 5]})
+
+    claimed = claim_all(job_queue)
+
+    # Newest first, the accounts take turns
+    assert claimed == [("a", 3), ("b", 5), ("a", 2), ("b", 4), ("a", 1)]
+    assert job_queue.claim() is None
+
+
+def test_finished_jobs_are_not_claimed_again(tmp_path):
+    job_queue = make_queue(tmp_path, {"a": [1, 2]})
+
+    exported = job_queue.claim()
+    failed = job_queue.claim()
+    assert exported is not None and failed is not None
+    job_queue.mark_exported(exported)
+    job_queue.mark_failed(failed, "error")
+    assert job_queue.claim() is None
+    assert job_queue.get_stats() == {"a": {EXPORTED: 1, FAILED: 1}}
+
+    # The next run retries the failed job
+    job_queue.start_run()
+    assert claim_all(job_queue) == [("a", 1)]
+
+
+def test_jobs_claimed_by_a_killed_run_are_claimed_again(tmp_path):
+    job_queue = make_queue(tmp_path, {"a": [1, 2]})
+    assert claim_all(job_queue) == [("a", 2), ("a", 1)]
+    job_queue.close()
+
+    job_queue = JobQueue(tmp_path / "jobs.sqlite3")
+    job_queue.start_run()
+    assert claim_all(job_queue) == [("a", 2), ("a", 1)]
+    assert job_queue.get_stats() == {"a": {PENDING: 2}}
+
+
+def test_files_without_the_claimed_column_are_migrated(tmp_path):
+    path = tmp_path / "jobs.sqlite3"
+    job_queue = make_queue(tmp_path, {"a": [1]})
+    job_queue.close()
+    with sqlite3.connect(path) as con:
+        con.execute("DROP INDEX jobs_unclaimed")
+        con.execute("ALTER TABLE jobs DROP COLUMN claimed")
+
+    job_queue = JobQueue(path)
+    job_queue.start_run()
+    assert claim_all(job_queue) == [("a", 1)]
+
+
+def test_claim_uses_the_unclaimed_index(tmp_path):
+    make_queue(tmp_path, {"a": [1]}).close()
+
+    with sqlite3.connect(tmp_path / "jobs.sqlite3") as con:
+        plan = " ".join(
+            row[-1]
+            for row in con.execute(
+                "EXPLAIN QUERY PLAN SELECT trackid FROM jobs "
+                f"WHERE account = ? AND {UNCLAIMED_JOBS} "
+                "ORDER BY trackid DESC LIMIT 1",
+                ("a",),
+            )
+        )
+    assert "jobs_unclaimed" in plan
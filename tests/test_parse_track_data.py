@@ -0,0 +1,104 @@
+import array
+
+import pytest
+
+from src.api import WorkoutDetailData, WorkoutSummary
+from src.exporters.base_exporter import (
+    NO_VALUE,
+    RawTrackData,
+    _parse_track_data_numpy,
+    _parse_track_data_python,
+    parse_track_data,
+)
+
+SUMMARY = WorkoutSummary(
+    trackid="1700000000",
+    source="run.mifit.huami.com",
+    dis="10000",
+    calorie="600",
+    end_time="1700003600",
+    run_time="3600",
+    avg_pace="0.36",
+    avg_frequency="170",
+    avg_heart_rate="150",
+    type=1,
+    location="",
+    city="",
+    forefoot_ratio="",
+    bind_device="",
+    version=1,
+    app_name="com.xiaomi.hm.health",
+)
+
+
+def as_lists(track_data: RawTrackData) -> dict:
+    return {
+        field: list(value) if isinstance(value, array.array) else value
+        for field, value in track_data._asdict().items()
+    }
+
+
+def make_detail(**fields: str) -> WorkoutDetailData:
+    empty_fields = {
+        field: ""
+        for field, info in WorkoutDetailData.model_fields.items()
+        if info.annotation is str
+    }
+    return WorkoutDetailData(
+        **{
+            **empty_fields,
+            "trackid": 1700000000,
+            "source": "",
+            "version": 1,
+            **fields,
+        }
+    )
+
+
+DETAILS = {
+    "regular": make_detail(
+        time="0;1;2;1",
+        longitude_latitude="4750000000,1900000000;100,-200;-50,25;0,0",
+        altitude="10000;10050;10100;10000",
+        heart_rate="0,120;1,2;1,-1;2,0",
+        gait="0,0,110,170;3,0,112,172;3,0,108,168",
+    ),
+    "empty heart rate times": make_detail(
+        time="0;1;1",
+        longitude_latitude="4750000000,1900000000;10,10;10,10",
+        altitude="10000;10000;10000",
+        heart_rate="0,120;,1;,1;5,-2",
+    ),
+    "trailing separators": make_detail(
+        time="0;1;1;",
+        longitude_latitude="4750000000,1900000000;10,10;10,10;",
+        altitude="10000;10000;10000;",
+        heart_rate="0,120;,1;",
+        gait="0,0,110,170;3,0,112,172;",
+    ),
+    "missing altitudes": make_detail(
+        time="0;1;1;1",
+        longitude_latitude="4750000000,1900000000;10,10;10,10;10,10",
+        altitude=f"{NO_VALUE};10000;{NO_VALUE};10200",
+    ),
+    "no points": make_detail(),
+}
+
+
+@pytest.mark.parametrize("detail", DETAILS.values(), ids=DETAILS.keys())
+def test_numpy_and_python_parsers_agree(detail: WorkoutDetailData):
+    assert as_lists(_parse_track_data_numpy(SUMMARY, detail)) == as_lists(
+        _parse_track_data_python(SUMMARY, detail)
+    )
+
+
+def test_inconsistent_rows_fall_back_to_python():
+    detail = make_detail(
+        time="0;1",
+        longitude_latitude="4750000000,1900000000;10,10,5",
+        altitude="10000;10000",
+    )
+
+    with pytest.raises(ValueError):
+        _parse_track_data_numpy(SUMMARY, detail)
+    assert list(parse_track_data(SUMMARY, detail).lat) == [4750000000, 10]
@@ -0,0 +1,35 @@
+import json
+
+from benchmarks.mock_server import MockApiServer
+from src.api import Api
+from src.exporters.registry import ExporterRegistry
+from src.profiler import WorkoutProfiler
+from src.scraper import Scraper
+
+
+def test_failed_workouts_are_profiled(tmp_path, monkeypatch):
+    exporter = ExporterRegistry().get_exporter("gpx")
+    export_many = exporter.export_many
+
+    with MockApiServer(num_workouts=3, duration=60) as server:
+        failing = server.summaries[1]
+
+        def fail_one(output_file_paths, summary, track):
+            if summary.trackid == failing.trackid:
+                raise OSError("Disk full")
+            export_many(output_file_paths, summary, track)
+
+        monkeypatch.setattr(exporter, "export_many", fail_one)
+        profiler = WorkoutProfiler(tmp_path / "profiles", top=3)
+        Scraper(
+            Api(server.endpoint, "token", max_retries=0),
+            {"gpx": exporter},
+            tmp_path / "workouts",
+            profiler=profiler,
+        ).run()
+
+    index = json.loads((tmp_path / "profiles" / "profiles.json").read_text())
+    assert {entry["trackid"]: entry["failed"] for entry in index} == {
+        summary.trackid: summary is failing for summary in server.summaries
+    }
+    assert all(entry["points"] > 0 for entry in index)
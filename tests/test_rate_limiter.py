@@ -0,0 +1,43 @@
+import time
+
+import pytest
+import requests
+
+from benchmarks.mock_server import MockApiServer
+from src.api import Api
+from src.rate_limiter import TokenBucket
+
+
+def test_token_bucket_allows_a_burst_then_the_rate():
+    bucket = TokenBucket(rate=20, capacity=5)
+
+    start = time.monotonic()
+    for _ in range(5):
+        bucket.acquire()
+    assert time.monotonic() - start < 0.05
+
+    for _ in range(4):
+        bucket.acquire()
+    assert time.monotonic() - start == pytest.approx(0.2, abs=0.1)
+
+
+def test_retries_acquire_a_token():
+    with MockApiServer(num_workouts=1) as server:
+        summary = server.summaries[0]
+        server.failing_track_ids.add(summary.trackid)
+        api = Api(server.endpoint, "", max_retries=2, backoff_factor=0, rate_limit=100)
+        assert api.rate_limiter
+        acquire = api.rate_limiter.acquire
+        acquired = []
+
+        def count_acquire():
+            acquired.append(True)
+            acquire()
+
+        api.rate_limiter.acquire = count_acquire
+
+        with pytest.raises(requests.RequestException):
+            api.get_workout_detail_raw(summary)
+
+        assert server.requests == 3
+        assert len(acquired) == 3